@@ -4,7 +4,7 @@ from pathlib import Path
 import os
 import config
 from utils.auth import get_profiles
-from utils.library import load_library
+from utils.library import library_snapshot
 
 class Exclude304Filter(logging.Filter):
     def filter(self, record):
@@ -23,7 +23,7 @@ def start_app():
     """Initialize the application"""
     config.logger.info("Starting Audible CLI Web App")
     # Load any existing library
-    library = load_library()
+    library = library_snapshot()
     if library:
         config.logger.info(f"Loaded existing library with {len(library)} books")
     else:
@@ -41,5 +41,13 @@ def start_app():
 # Import routes after app creation to avoid circular imports
 from routes import *
 
+# Clear out scratch space from conversions that died with a previous run
+from utils.workspace import sweep_workspaces
+sweep_workspaces()
+
+# Pick up jobs left queued or running when the app last stopped
+from utils.jobs import resume_jobs
+resume_jobs()
+
 if __name__ == '__main__':
     start_app()
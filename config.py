@@ -11,6 +11,81 @@ IMAGES_DIR = '/books/images'
 PDF_DIR = '/books/pdfs'
 TMP_DIR = '/tmp'
 LIBRARY_FILE = f"{CONFIG_DIR}/library.json"
+LIBRARY_DB = f"{CONFIG_DIR}/library.db"
+LIBRARY_BACKEND = os.getenv('LIBRARY_BACKEND', 'sqlite').lower()  # 'sqlite' or 'json'
+
+# Library write-behind: coalesce saves and flush after an interval or once enough books are dirty
+LIBRARY_WRITE_BEHIND = os.getenv('LIBRARY_WRITE_BEHIND', '1') == '1'
+LIBRARY_FLUSH_INTERVAL = float(os.getenv('LIBRARY_FLUSH_INTERVAL', '0.5'))
+LIBRARY_FLUSH_MAX_PENDING = int(os.getenv('LIBRARY_FLUSH_MAX_PENDING', '200'))
+
+# Books rendered per profile on the first load of /library; the rest stream in from /api/library
+LIBRARY_PAGE_SIZE = int(os.getenv('LIBRARY_PAGE_SIZE', '100'))
+# Number of recent book changes kept for /api/library/changes delta sync
+LIBRARY_CHANGE_LOG_SIZE = int(os.getenv('LIBRARY_CHANGE_LOG_SIZE', '5000'))
+# How long browsers may reuse a cover image before revalidating it, in seconds
+COVER_CACHE_MAX_AGE = int(os.getenv('COVER_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+
+# Pre-sized cover variants (name -> max edge in pixels), kept next to the originals
+THUMBNAIL_DIR = f"{IMAGES_DIR}/thumbs"
+THUMBNAIL_SIZES = {'thumb': 120, 'medium': 400}
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_MB', '200')) * 1024 * 1024
+
+# Worker threads running background jobs, and how many of them may download or convert at once
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '6'))
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', '4'))
+DOWNLOAD_PROFILE_CONCURRENCY = int(os.getenv('DOWNLOAD_PROFILE_CONCURRENCY', '4'))
+CONVERSION_CONCURRENCY = int(os.getenv('CONVERSION_CONCURRENCY', '1'))
+# Multi-part books: 'stream' pipes each decrypted part, one after another, straight into the final mux
+# (no scratch space, but no parallel decode); 'scratch' decodes parts concurrently to files in the
+# conversion's workspace first (and is the fallback)
+MULTIPART_CONCAT_MODE = os.getenv('MULTIPART_CONCAT_MODE', 'stream')
+# Per-conversion workspaces; keep this on M4B_DIR's filesystem so finished books are renamed, not copied
+CONVERSION_SCRATCH_DIR = os.getenv('CONVERSION_SCRATCH_DIR', f"{M4B_DIR}/.scratch")
+# Free space left over on the scratch volume after a conversion's estimated needs
+SCRATCH_MIN_FREE_BYTES = int(os.getenv('SCRATCH_MIN_FREE_MB', '512')) * 1024 * 1024
+# Parts of a multi-part book decoded at once in 'scratch' mode (each is a copy remux, mostly I/O bound)
+PART_DECODE_CONCURRENCY = int(os.getenv('PART_DECODE_CONCURRENCY', '4'))
+# Share of job starts each priority lane gets while several have work queued
+JOB_LANE_WEIGHTS = {
+    'interactive': int(os.getenv('JOB_WEIGHT_INTERACTIVE', '8')),
+    'sync': int(os.getenv('JOB_WEIGHT_SYNC', '3')),
+    'bulk': int(os.getenv('JOB_WEIGHT_BULK', '1')),
+}
+# Pending cover/PDF downloads for one profile fetched by a single audible-cli process
+DOWNLOAD_GROUP_SIZE = int(os.getenv('DOWNLOAD_GROUP_SIZE', '50'))
+
+# Direct HTTP cover fetching from cover_url: parallel requests, retries and base backoff (seconds)
+COVER_FETCH_CONCURRENCY = int(os.getenv('COVER_FETCH_CONCURRENCY', '8'))
+COVER_FETCH_RETRIES = int(os.getenv('COVER_FETCH_RETRIES', '3'))
+COVER_FETCH_BACKOFF = float(os.getenv('COVER_FETCH_BACKOFF', '0.5'))
+
+# Adaptive (AIMD) download concurrency: DOWNLOAD_CONCURRENCY is the starting window
+DOWNLOAD_ADAPTIVE = os.getenv('DOWNLOAD_ADAPTIVE', '1') == '1'
+DOWNLOAD_MAX_CONCURRENCY = int(os.getenv('DOWNLOAD_MAX_CONCURRENCY', '8'))
+DOWNLOAD_GOOD_RATE = float(os.getenv('DOWNLOAD_GOOD_RATE_KBPS', '256')) * 1000  # bytes/sec
+DOWNLOAD_STALL_SECONDS = float(os.getenv('DOWNLOAD_STALL_SECONDS', '120'))
+DOWNLOAD_BACKOFF_COOLDOWN = float(os.getenv('DOWNLOAD_BACKOFF_COOLDOWN', '30'))
+
+# Lines of recent stdout/stderr kept per child process for error reports
+PROCESS_TAIL_LINES = int(os.getenv('PROCESS_TAIL_LINES', '200'))
+
+# ffmpeg throughput samples kept per conversion step for the status history, and seconds between them
+CONVERSION_HISTORY_SAMPLES = int(os.getenv('CONVERSION_HISTORY_SAMPLES', '120'))
+CONVERSION_HISTORY_INTERVAL = float(os.getenv('CONVERSION_HISTORY_INTERVAL', '5'))
+
+# Server-Sent Events: concurrent /events clients (each holds a server thread), undelivered
+# events kept per client before it is told to resync, and minimum seconds between progress updates
+EVENTS_MAX_CLIENTS = int(os.getenv('EVENTS_MAX_CLIENTS', '4'))
+EVENTS_QUEUE_MAX = int(os.getenv('EVENTS_QUEUE_MAX', '500'))
+EVENTS_PROGRESS_INTERVAL = float(os.getenv('EVENTS_PROGRESS_INTERVAL', '0.5'))
+EVENTS_KEEPALIVE = float(os.getenv('EVENTS_KEEPALIVE', '15'))
+
+# Jobs are persisted so queued and interrupted ones resume after a restart
+JOBS_DB = f"{CONFIG_DIR}/jobs.db"
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+
 KEY_FILE = f"{CONFIG_DIR}/activation.txt"
 
 # Configure logging
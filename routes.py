@@ -1,10 +1,16 @@
-from flask import render_template, request, jsonify, send_file
+from flask import render_template, request, jsonify, send_file, make_response, Response
 from app import app
 import config
 from utils.auth import get_profiles, handle_quickstart, handle_additional_profile
-from utils.library import load_library, save_library, verify_files, update_book_database
-from utils.files import download_content, get_file_status, download_status, DownloadType
-from utils.converter import convert_book
+from utils.library_index import ALL_PROFILES
+from utils.library import verify_files, update_book_database, library_snapshot, library_transaction, query_library, library_stats, library_page, library_version, library_changes, cover_path, thaw, export_library_json
+from utils.files import get_file_status, download_status
+from utils.converter import conversion_progress
+from utils.thumbnails import get_thumbnail
+from utils.jobs import JOB_HANDLERS, submit_job, get_job, get_job_queue, cancel_job
+from utils.batches import create_batch, batch_progress, batch_results, cancel_batch
+from utils.concurrency import download_controller
+from utils.events import event_bus, format_event
 import os
 import subprocess
 from utils.common import run_command
@@ -18,7 +24,7 @@ process = None
 def index():
     """Main page view"""
     config_file = Path(config.CONFIG_DIR) / 'config.toml'
-    library = load_library()
+    library = library_snapshot()
     profiles = get_profiles()
 
     return render_template('index.html',
@@ -33,9 +39,9 @@ def get_process_file():
 @app.route('/book-status/<asin>')
 def book_status(asin):
     """Get current status of a book"""
-    library = load_library()
+    library = library_snapshot()
     if asin in library:
-        return jsonify(library[asin])
+        return jsonify(thaw(library[asin]))
     else:
         return jsonify({'error': 'Book not found'}), 404
 
@@ -176,100 +182,93 @@ def view_library():
     """View library and manage books"""
     from utils.converter import conversion_status
 
-    library = load_library()
     profiles = get_profiles()
-
-    # Initialize stats
-    total_audible_files = 0
-    total_m4b_files = 0
-    total_pdf_files = 0
-    total_audible_size = 0
-    total_m4b_size = 0
-    total_pdf_size = 0
-    total_locked = 0
-
-    # Initialize profile stats
-    profile_stats = {profile['name']: {
-        'audible_total': 0,
-        'audible_size': 0,
-        'm4b_total': 0,
-        'm4b_size': 0,
-        'pdf_total': 0,
-        'pdf_size': 0,
-        'locked': 0
-    } for profile in profiles}
-
-    # Initialize collections
-    libraries = {profile['name']: [] for profile in profiles}
-    unassigned_books = []
-
-    # Process all books
-    for asin, book in library.items():
-        # Count locked books
-        if book.get('locked', False):
-            total_locked += 1
-
-        # Calculate sizes and counts
-        if book.get('audible_file'):
-            total_audible_files += 1
-            total_audible_size += book.get('audible_size', 0) or 0
-
-        if book.get('m4b_file'):
-            total_m4b_files += 1
-            total_m4b_size += book.get('m4b_size', 0) or 0
-
-        if book.get('pdf_file'):
-            total_pdf_files += 1
-            total_pdf_size += book.get('pdf_size', 0) or 0
-
-        # Sort into collections
-        book_profiles = book.get('profiles', [])
-        if book_profiles:
-            for profile_name in book_profiles:
-                if profile_name in libraries:
-                    libraries[profile_name].append(book)
-                    # Add to profile stats
-                    if book.get('audible_file'):
-                        profile_stats[profile_name]['audible_total'] += 1
-                        profile_stats[profile_name]['audible_size'] += book.get('audible_size', 0) or 0
-                    if book.get('m4b_file'):
-                        profile_stats[profile_name]['m4b_total'] += 1
-                        profile_stats[profile_name]['m4b_size'] += book.get('m4b_size', 0) or 0
-                    if book.get('pdf_file'):
-                        profile_stats[profile_name]['pdf_total'] += 1
-                        profile_stats[profile_name]['pdf_size'] += book.get('pdf_size', 0) or 0
-                    if book.get('locked', False):
-                        profile_stats[profile_name]['locked'] += 1
-        else:
-            unassigned_books.append(book)
-
-    # Calculate unassigned stats
-    unassigned_stats = {
-        'audible_size': sum(book.get('audible_size', 0) or 0 for book in unassigned_books),
-        'm4b_size': sum(book.get('m4b_size', 0) or 0 for book in unassigned_books),
-        'pdf_size': sum(book.get('pdf_size', 0) or 0 for book in unassigned_books)
-    }
+    profile_names = [profile['name'] for profile in profiles]
+
+    # Taken first so the page's delta sync replays anything that changes while rendering
+    current_version = library_version()
+
+    # Aggregates are maintained incrementally by the library layer
+    stats = library_stats(profile_names)
+    totals = stats['totals']
+    profile_stats = {name: stats['profiles'][name] for name in profile_names}
+    unassigned_stats = stats['unassigned']
+
+    # Render the first page of each profile; the page streams the rest from /api/library
+    libraries = {}
+    library_cursors = {}
+    for name in profile_names:
+        page = library_page(profile=name, limit=config.LIBRARY_PAGE_SIZE)
+        libraries[name] = page['books']
+        library_cursors[name] = page['next_cursor']
+    unassigned_books = [book for _, book in query_library('all', None)]
 
     return render_template(
         'library.html',
         profiles=profiles,
         libraries=libraries,
+        library_cursors=library_cursors,
+        library_version=current_version,
         download_status=download_status,
         conversion_status=conversion_status,
-        total_audible_files=total_audible_files,
-        total_m4b_files=total_m4b_files,
-        total_pdf_files=total_pdf_files,
-        total_audible_size=total_audible_size,
-        total_m4b_size=total_m4b_size,
-        total_pdf_size=total_pdf_size,
-        total_books=len(library),
-        total_locked=total_locked,
+        total_audible_files=totals['audible_total'],
+        total_m4b_files=totals['m4b_total'],
+        total_pdf_files=totals['pdf_total'],
+        total_audible_size=totals['audible_size'],
+        total_m4b_size=totals['m4b_size'],
+        total_pdf_size=totals['pdf_size'],
+        total_books=totals['books'],
+        total_locked=totals['locked'],
         unassigned_books=unassigned_books,
         unassigned_count=len(unassigned_books),
         profile_stats=profile_stats,
         unassigned_stats=unassigned_stats
     )
 
+@app.route('/api/stats')
+def api_stats():
+    """Library totals, per-profile and unassigned counts and sizes as JSON"""
+    profile_names = [profile['name'] for profile in get_profiles()]
+    return jsonify(library_stats(profile_names))
+
+@app.route('/api/library')
+def api_library():
+    """Paginated, filterable library listing with weak ETag revalidation"""
+    etag = library_version()
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    profile = request.args.get('profile', ALL_PROFILES)
+    if profile == 'unassigned':
+        profile = None
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', config.LIBRARY_PAGE_SIZE)), 500))
+        page = library_page(
+            profile=profile,
+            sort=request.args.get('sort', 'title'),
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            fields=fields
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    response = jsonify(page)
+    response.set_etag(page['version'], weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/library/changes')
+def api_library_changes():
+    """Books changed since a library version, for keeping open pages current"""
+    since = request.args.get('since', '')
+    if since and since == library_version():
+        return jsonify({'version': since, 'reset': False, 'books': [], 'removed': []})
+    return jsonify(library_changes(since))
+
 @app.route('/update-library', methods=['POST'])
 def update_library():
     """Update library from Audible for a specific profile"""
@@ -285,9 +284,6 @@ def update_library():
 
         config.logger.info(f"Updating library for profile: {profile_name}")
 
-        # Get current library
-        library = load_library()
-
         # Get books from Audible
         books = update_book_database(profile_name)
         if not books:
@@ -298,41 +294,36 @@ def update_library():
 
         # Update each book
         changes_made = False
-        for book in books:
-            asin = book['asin']
-            if asin in library:
-                # Update existing book
-                existing_profiles = library[asin].get('profiles', [])
-                if profile_name not in existing_profiles:
-                    existing_profiles.append(profile_name)
+        with library_transaction() as library:
+            for book in books:
+                asin = book['asin']
+                if asin in library:
+                    # Update existing book
+                    existing_profiles = library[asin].get('profiles', [])
+                    if profile_name not in existing_profiles:
+                        existing_profiles.append(profile_name)
+                        changes_made = True
+
+                    # Update metadata while preserving file info
+                    for key, value in book.items():
+                        if key not in ['audible_file', 'audible_size', 'audible_format',
+                                     'm4b_file', 'm4b_size', 'cover_path']:
+                            if library[asin].get(key) != value:
+                                library[asin][key] = value
+                                changes_made = True
+
+                    library[asin]['profiles'] = existing_profiles
+                else:
+                    # Add new book
+                    book['profiles'] = [profile_name]
+                    library[asin] = book
                     changes_made = True
 
-                # Update metadata while preserving file info
-                for key, value in book.items():
-                    if key not in ['audible_file', 'audible_size', 'audible_format',
-                                 'm4b_file', 'm4b_size', 'cover_path']:
-                        if library[asin].get(key) != value:
-                            library[asin][key] = value
-                            changes_made = True
-
-                library[asin]['profiles'] = existing_profiles
-            else:
-                # Add new book
-                book['profiles'] = [profile_name]
-                library[asin] = book
-                changes_made = True
-
         if changes_made:
-            if save_library(library):
-                return jsonify({
-                    'success': True,
-                    'message': f'Library updated for profile {profile_name}'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Failed to save library after updates'
-                })
+            return jsonify({
+                'success': True,
+                'message': f'Library updated for profile {profile_name}'
+            })
         else:
             return jsonify({
                 'success': True,
@@ -362,13 +353,14 @@ def download_route(profile, asin):
     # Get download options
     options = request.get_json() if request.is_json else {}
 
-    return jsonify(download_content(profile, asin, DownloadType.BOOK, options))
+    job = submit_job('download_book', profile=profile, asin=asin, options=options)
+    return jsonify({'success': True, 'job_id': job.id})
 
 @app.route('/download-status/<asin>')
 def download_status_route(asin):
     """Get status of a download in progress"""
     # Check if book exists in library
-    library = load_library()
+    library = library_snapshot()
     if asin not in library:
         return jsonify({
             'error': 'Book not found',
@@ -409,18 +401,27 @@ def download_status_route(asin):
 @app.route('/convert/<asin>', methods=['POST'])
 def convert_route(asin):
     """Handle book conversion request"""
-    return jsonify(convert_book(asin))
+    job = submit_job('convert', asin=asin)
+    return jsonify({'success': True, 'job_id': job.id})
+
+@app.route('/conversion-status/<asin>')
+def conversion_status_route(asin):
+    """Percent, speed, ETA and throughput history of a book's latest conversion"""
+    progress = conversion_progress(asin)
+    if progress is None:
+        return jsonify({'state': 'not_started', 'complete': False})
+    return jsonify(dict(progress, complete=progress['state'] != 'converting'))
 
 @app.route('/download-cover/<profile>/<asin>', methods=['POST'])
 def download_cover_route(profile, asin):
     """Handle cover download request"""
-    return jsonify(download_content(profile, asin, DownloadType.COVER))
+    job = submit_job('download_cover', profile=profile, asin=asin)
+    return jsonify({'success': True, 'job_id': job.id})
 
 @app.route('/download-all/<profile>', methods=['POST'])
 def download_all(profile):
     """Download all missing books for a profile"""
     try:
-        library = load_library()
         profiles = get_profiles()
 
         if not any(p['name'] == profile for p in profiles):
@@ -435,10 +436,7 @@ def download_all(profile):
                 'asin': asin,
                 'title': book.get('amazon_title', 'Unknown')
             }
-            for asin, book in library.items()
-            if profile in book.get('profiles', []) 
-            and not book.get('audible_file')
-            and not book.get('locked', False)  # Skip already locked books
+            for asin, book in query_library('missing_audible', profile)
         ]
         
         # Count locked books
@@ -447,10 +445,8 @@ def download_all(profile):
                 'asin': asin,
                 'title': book.get('amazon_title', 'Unknown')
             }
-            for asin, book in library.items()
-            if profile in book.get('profiles', []) 
-            and not book.get('audible_file')
-            and book.get('locked', False)  # Count locked books
+            for asin, book in query_library('locked', profile)
+            if not book.get('audible_file')
         ]
 
         if not to_download and not locked_books:
@@ -459,12 +455,12 @@ def download_all(profile):
                 'message': 'No new books to download'
             })
 
-        # Return initial response to start the process
+        batch_id = create_batch('books', profile, [book['asin'] for book in to_download], len(locked_books))
         return jsonify({
             'success': True,
+            'batch_id': batch_id,
             'total': len(to_download),
             'locked_count': len(locked_books),
-            'asin_list': [book['asin'] for book in to_download],
             'message': f'Starting download of {len(to_download)} books. Skipping {len(locked_books)} locked books.'
         })
 
@@ -475,111 +471,16 @@ def download_all(profile):
             'error': str(e)
         })
 
-@app.route('/download-book-batch', methods=['POST'])
-def download_book_batch():
-    """Process a batch of books one by one with status updates"""
-    try:
-        data = request.get_json()
-        profile = data.get('profile')
-        asin_list = data.get('asin_list', [])
-        current_index = data.get('current_index', 0)
-        results = data.get('results', {
-            'total': len(asin_list),
-            'downloaded': 0,
-            'failed': 0,
-            'failures': [],
-            'books': []
-        })
-        
-        # If all books processed, return final results
-        if current_index >= len(asin_list):
-            return jsonify({
-                'success': True,
-                'complete': True,
-                'results': results
-            })
-            
-        # Process the current book
-        asin = asin_list[current_index]
-        
-        # Get the book title for better logging
-        library = load_library()
-        book_title = library.get(asin, {}).get('amazon_title', 'Unknown')
-        
-        config.logger.info(f"Batch processing book {current_index+1}/{len(asin_list)}: {book_title} ({asin})")
-        
-        # Use the existing download_content function
-        result = download_content(profile, asin, DownloadType.BOOK)
-        
-        book_info = {
-            'asin': asin,
-            'title': book_title,
-            'index': current_index
-        }
-
-        # Reload library to get updated file sizes
-        updated_library = load_library()
-        
-        if result['success']:
-            results['downloaded'] += 1
-            book_info['status'] = 'downloaded'
-            book_info['file'] = result.get('file', '')
-
-            # Get updated file size from library
-            if asin in updated_library and updated_library[asin].get('audible_size'):
-                book_info['size'] = updated_library[asin]['audible_size']
-            else:
-                # If size not in library, try to get it from the file
-                if result.get('file') and os.path.exists(result['file']):
-                    book_info['size'] = os.path.getsize(result['file'])
-                else:
-                    book_info['size'] = 0
-        else:
-            results['failed'] += 1
-            book_info['status'] = 'failed'
-            book_info['error'] = result.get('error', 'Unknown error')
-            
-            if result.get('status') == 'locked' or 'locked' in result.get('error', '').lower():
-                book_info['locked'] = True
-                
-            results['failures'].append({
-                'asin': asin,
-                'title': book_title,
-                'error': result.get('error', 'Unknown error')
-            })
-            
-        results['books'].append(book_info)
-        
-        # Return progress update
-        return jsonify({
-            'success': True,
-            'complete': False,
-            'current_index': current_index + 1,
-            'profile': profile,
-            'asin_list': asin_list,
-            'current_book': book_info,
-            'results': results
-        })
-        
-    except Exception as e:
-        config.logger.error(f"Book batch processing failed: {e}", exc_info=True)
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        })
-
 @app.route('/download-all-covers/<profile>', methods=['POST'])
 def download_all_covers(profile):
     """Download all missing covers for a profile"""
     try:
-        library = load_library()
         to_download = [
             {
                 'asin': asin,
                 'title': book.get('amazon_title', 'Unknown')
             }
-            for asin, book in library.items()
-            if profile in book.get('profiles', []) and not book.get('cover_path')
+            for asin, book in query_library('missing_cover', profile)
         ]
 
         if not to_download:
@@ -588,11 +489,11 @@ def download_all_covers(profile):
                 'message': 'No covers to download'
             })
 
-        # Return initial response to start the process
+        batch_id = create_batch('covers', profile, [book['asin'] for book in to_download])
         return jsonify({
             'success': True,
+            'batch_id': batch_id,
             'total': len(to_download),
-            'asin_list': [book['asin'] for book in to_download],
             'message': f'Starting download of {len(to_download)} covers'
         })
 
@@ -600,171 +501,32 @@ def download_all_covers(profile):
         config.logger.error(f"Bulk cover download failed: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/download-cover-batch', methods=['POST'])
-def download_cover_batch():
-    """Process a batch of cover downloads one by one with status updates"""
-    try:
-        data = request.get_json()
-        profile = data.get('profile')
-        asin_list = data.get('asin_list', [])
-        current_index = data.get('current_index', 0)
-        results = data.get('results', {
-            'total': len(asin_list),
-            'downloaded': 0,
-            'failed': 0,
-            'failures': [],
-            'books': []
-        })
-        
-        # If all covers processed, return final results
-        if current_index >= len(asin_list):
-            return jsonify({
-                'success': True,
-                'complete': True,
-                'results': results
-            })
-            
-        # Process the current cover
-        asin = asin_list[current_index]
-        
-        # Get the book title for better logging
-        library = load_library()
-        book_title = library.get(asin, {}).get('amazon_title', 'Unknown')
-        
-        config.logger.info(f"Batch cover download {current_index+1}/{len(asin_list)}: {book_title} ({asin})")
-        
-        # Use the existing download_content function with DownloadType.COVER
-        result = download_content(profile, asin, DownloadType.COVER)
-        
-        book_info = {
-            'asin': asin,
-            'title': book_title,
-            'index': current_index
-        }
-        
-        # Reload library to get updated file path
-        updated_library = load_library()
-        
-        if result['success']:
-            results['downloaded'] += 1
-            book_info['status'] = 'downloaded'
-            book_info['file'] = result.get('file', '')
-            
-            # Get path from updated library
-            if asin in updated_library and updated_library[asin].get('cover_path'):
-                book_info['cover_path'] = updated_library[asin]['cover_path']
-        else:
-            results['failed'] += 1
-            book_info['status'] = 'failed'
-            book_info['error'] = result.get('error', 'Unknown error')
-            
-            results['failures'].append({
-                'asin': asin,
-                'title': book_title,
-                'error': result.get('error', 'Unknown error')
-            })
-            
-        results['books'].append(book_info)
-        
-        # Return progress update
-        return jsonify({
-            'success': True,
-            'complete': False,
-            'current_index': current_index + 1,
-            'profile': profile,
-            'asin_list': asin_list,
-            'current_book': book_info,
-            'results': results
-        })
-        
-    except Exception as e:
-        config.logger.error(f"Cover batch processing failed: {e}", exc_info=True)
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        })
-
 @app.route('/download-pdf/<profile>/<asin>', methods=['POST'])
 def download_pdf_route(profile, asin):
     """Handle PDF download request"""
-    result = download_content(profile, asin, DownloadType.PDF)
-    
-    # If no PDF is available, return a properly formatted response
-    if not result['success'] and 'message' in result and 'No PDF available' in result['message']:
-        return jsonify({
-            'success': False,
-            'error': f"No PDF available for this book"
-        })
-    
-    # For other failures, return the error message
-    if not result['success']:
-        return jsonify({
-            'success': False,
-            'error': result.get('error', 'Unknown error during PDF download')
-        })
-    
-    # Get the file size from the library for successful downloads
-    library = load_library()
-    pdf_size = 0
-    if asin in library and library[asin].get('pdf_size'):
-        pdf_size = library[asin]['pdf_size']
-
-    # For successful downloads
-    return jsonify({
-        'success': True,
-        'file': result.get('file', ''),
-        'message': result.get('message', 'PDF downloaded successfully')
-    })
+    job = submit_job('download_pdf', profile=profile, asin=asin)
+    return jsonify({'success': True, 'job_id': job.id})
 
 @app.route('/download-all-pdfs/<profile>', methods=['POST'])
 def download_all_pdfs(profile):
     """Download all missing PDFs for a profile"""
     try:
-        library = load_library()
         # Get books that don't have PDF status set or don't have the file
-        to_download = [
-            asin for asin, book in library.items()
-            if profile in book.get('profiles', [])
-            and ('pdf_available' not in book or
-                 (book.get('pdf_available', True) and not book.get('pdf_file')))
-        ]
+        to_download = [asin for asin, book in query_library('pdf_unknown', profile)]
+
+        if not to_download:
+            return jsonify({
+                'success': True,
+                'message': 'No PDFs to process'
+            })
 
-        results = {
+        batch_id = create_batch('pdfs', profile, to_download)
+        return jsonify({
             'success': True,
+            'batch_id': batch_id,
             'total': len(to_download),
-            'downloaded': 0,
-            'not_available': 0,
-            'failed': 0,
-            'failures': [],
-            'books': []
-        }
-
-        for asin in to_download:
-            result = download_content(profile, asin, DownloadType.PDF)
-            book_info = {
-                'asin': asin,
-                'title': library[asin].get('amazon_title', 'Unknown')
-            }
-
-            if result['success']:
-                results['downloaded'] += 1
-                book_info['pdf_file'] = result.get('file')
-                book_info['pdf_size'] = library[asin].get('pdf_size', 0)
-            elif result.get('message') == 'No PDF available for this book' or 'No PDF found' in result.get('error', ''):
-                results['not_available'] += 1
-                book_info['pdf_available'] = False
-            else:
-                results['failed'] += 1
-                book_info['error'] = result.get('error', 'Unknown error')
-                results['failures'].append({
-                    'asin': asin,
-                    'title': library[asin].get('amazon_title', 'Unknown'),
-                    'error': result.get('error', 'Unknown error')
-                })
-            
-            results['books'].append(book_info)
-
-        return jsonify(results)
+            'message': f'Starting download of {len(to_download)} PDFs'
+        })
 
     except Exception as e:
         config.logger.error(f"Bulk PDF download failed: {e}", exc_info=True)
@@ -774,18 +536,13 @@ def download_all_pdfs(profile):
 def list_missing_pdfs(profile):
     """Get list of books that need PDF processing"""
     try:
-        library = load_library()
-        
         # Get books that don't have PDF status set or don't have the file
         books_to_process = [
             {
                 'asin': asin,
                 'title': book.get('amazon_title', 'Unknown')
             }
-            for asin, book in library.items()
-            if profile in book.get('profiles', [])
-            and ('pdf_available' not in book or
-                 (book.get('pdf_available', True) and not book.get('pdf_file')))
+            for asin, book in query_library('pdf_unknown', profile)
         ]
 
         return jsonify({
@@ -842,6 +599,18 @@ def rescan():
             'error': str(e)
         })
 
+@app.route('/export-library')
+def export_library():
+    """Export the library as a JSON document"""
+    try:
+        export_path = Path(config.CONFIG_DIR) / 'library-export.json'
+        count = export_library_json(export_path)
+        config.logger.info(f"Exported {count} books to {export_path}")
+        return send_file(export_path, as_attachment=True, download_name='library.json')
+    except Exception as e:
+        config.logger.error(f"Library export failed: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/assign-book', methods=['POST'])
 def assign_book():
     """Assign a book to a profile"""
@@ -860,29 +629,26 @@ def assign_book():
                 'error': f'Profile {profile} not found'
             })
 
-        library = load_library()
-        if asin not in library:
-            return jsonify({'success': False, 'error': 'Book not found'})
-
-        if 'profiles' not in library[asin]:
-            library[asin]['profiles'] = []
+        with library_transaction(asin) as book:
+            if book is None:
+                return jsonify({'success': False, 'error': 'Book not found'})
 
-        if profile not in library[asin]['profiles']:
-            library[asin]['profiles'].append(profile)
+            if 'profiles' not in book:
+                book['profiles'] = []
 
-            if save_library(library):
+            if profile in book['profiles']:
                 return jsonify({
                     'success': True,
-                    'profiles': library[asin]['profiles']
+                    'message': 'Profile already assigned',
+                    'profiles': book['profiles']
                 })
-            else:
-                return jsonify({'success': False, 'error': 'Failed to save library'})
-        else:
-            return jsonify({
-                'success': True,
-                'message': 'Profile already assigned',
-                'profiles': library[asin]['profiles']
-            })
+
+            book['profiles'].append(profile)
+
+        return jsonify({
+            'success': True,
+            'profiles': book['profiles']
+        })
 
     except Exception as e:
         config.logger.error(f"Failed to assign book: {e}", exc_info=True)
@@ -909,58 +675,56 @@ def delete_file():
         if not asin or not file_type:
             return jsonify({'success': False, 'error': 'Missing ASIN or file type'})
 
-        library = load_library()
-        if asin not in library:
-            return jsonify({'success': False, 'error': 'Book not found'})
-
-        book = library[asin]
         files_deleted = []
 
-        if file_type == 'audible':
-            # Delete main audio file
-            if book.get('audible_file'):
-                try:
-                    audio_path = Path(book['audible_file'])
-                    if audio_path.exists():
-                        audio_path.unlink()
-                        config.logger.info(f"Deleted audio file: {audio_path}")
-                        files_deleted.append(str(audio_path))
-                except Exception as e:
-                    config.logger.error(f"Error deleting audio file: {e}")
-
-                # Clean up associated fields
-                del book['audible_file']
-                del book['audible_size']
-                if 'audible_format' in book:
-                    del book['audible_format']
-
-            # Always check and clean up voucher file if it exists
-            if book.get('voucher_file'):
-                try:
-                    voucher_path = Path(book['voucher_file'])
-                    if voucher_path.exists():
-                        voucher_path.unlink()
-                        config.logger.info(f"Deleted voucher file: {voucher_path}")
-                        files_deleted.append(str(voucher_path))
-                except Exception as e:
-                    config.logger.error(f"Error deleting voucher file: {e}")
-                del book['voucher_file']
-
-        elif file_type == 'm4b':
-            if book.get('m4b_file'):
-                try:
-                    m4b_path = Path(book['m4b_file'])
-                    if m4b_path.exists():
-                        m4b_path.unlink()
-                        config.logger.info(f"Deleted M4B file: {m4b_path}")
-                        files_deleted.append(str(m4b_path))
-                except Exception as e:
-                    config.logger.error(f"Error deleting M4B file: {e}")
-
-                del book['m4b_file']
-                del book['m4b_size']
-
-        save_library(library)
+        with library_transaction(asin) as book:
+            if book is None:
+                return jsonify({'success': False, 'error': 'Book not found'})
+
+            if file_type == 'audible':
+                # Delete main audio file
+                if book.get('audible_file'):
+                    try:
+                        audio_path = Path(book['audible_file'])
+                        if audio_path.exists():
+                            audio_path.unlink()
+                            config.logger.info(f"Deleted audio file: {audio_path}")
+                            files_deleted.append(str(audio_path))
+                    except Exception as e:
+                        config.logger.error(f"Error deleting audio file: {e}")
+
+                    # Clean up associated fields
+                    del book['audible_file']
+                    del book['audible_size']
+                    if 'audible_format' in book:
+                        del book['audible_format']
+
+                # Always check and clean up voucher file if it exists
+                if book.get('voucher_file'):
+                    try:
+                        voucher_path = Path(book['voucher_file'])
+                        if voucher_path.exists():
+                            voucher_path.unlink()
+                            config.logger.info(f"Deleted voucher file: {voucher_path}")
+                            files_deleted.append(str(voucher_path))
+                    except Exception as e:
+                        config.logger.error(f"Error deleting voucher file: {e}")
+                    del book['voucher_file']
+
+            elif file_type == 'm4b':
+                if book.get('m4b_file'):
+                    try:
+                        m4b_path = Path(book['m4b_file'])
+                        if m4b_path.exists():
+                            m4b_path.unlink()
+                            config.logger.info(f"Deleted M4B file: {m4b_path}")
+                            files_deleted.append(str(m4b_path))
+                    except Exception as e:
+                        config.logger.error(f"Error deleting M4B file: {e}")
+
+                    del book['m4b_file']
+                    del book['m4b_size']
+
         return jsonify({'success': True, 'deleted': files_deleted})
 
     except Exception as e:
@@ -969,16 +733,40 @@ def delete_file():
 
 @app.route('/cover/<asin>')
 def get_cover(asin):
-    """Serve a book's cover image"""
-    library = load_library()
-    if asin in library and library[asin].get('cover_path'):
-        return send_file(library[asin]['cover_path'])
-    return '', 404
+    """Serve a book's cover image with validators for cheap revalidation"""
+    path = cover_path(asin)
+    if not path:
+        return '', 404
+    size = request.args.get('size')
+    if size in config.THUMBNAIL_SIZES:
+        # Fall back to the original if the variant can't be produced
+        path = get_thumbnail(asin, path, size) or path
+    try:
+        st = os.stat(path)
+    except OSError:
+        return '', 404
+
+    etag = f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+    # Answer conditional requests from the stat alone, without opening the image
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = request.if_modified_since is not None and \
+            int(st.st_mtime) <= request.if_modified_since.timestamp()
+    if not_modified:
+        response = make_response('', 304)
+    else:
+        response = send_file(path, etag=etag, last_modified=st.st_mtime, conditional=False)
+    response.set_etag(etag)
+    response.last_modified = st.st_mtime
+    response.cache_control.public = True
+    response.cache_control.max_age = config.COVER_CACHE_MAX_AGE
+    return response
 
 @app.route('/pdf/<asin>')
 def get_pdf(asin):
     """Serve a book's PDF if available"""
-    library = load_library()
+    library = library_snapshot()
     if asin in library and library[asin].get('pdf_file'):
         filename = os.path.basename(library[asin]['pdf_file'])
         return send_file(
@@ -1013,16 +801,12 @@ def convert_all_route(profile):
     try:
         from utils.converter import convert_book, conversion_status
 
-        library = load_library()
         to_convert = [
             {
                 'asin': asin,
                 'title': book.get('amazon_title', 'Unknown')
             }
-            for asin, book in library.items()
-            if profile in book.get('profiles', []) 
-            and book.get('audible_file') 
-            and not book.get('m4b_file')
+            for asin, book in query_library('convertible', profile)
         ]
 
         if not to_convert:
@@ -1031,11 +815,11 @@ def convert_all_route(profile):
                 'message': 'No books to convert'
             })
 
-        # Return initial response to start the process
+        batch_id = create_batch('convert', profile, [book['asin'] for book in to_convert])
         return jsonify({
             'success': True,
+            'batch_id': batch_id,
             'total': len(to_convert),
-            'asin_list': [book['asin'] for book in to_convert],
             'message': f'Starting conversion of {len(to_convert)} books'
         })
 
@@ -1046,96 +830,6 @@ def convert_all_route(profile):
             'error': str(e)
         })
 
-@app.route('/convert-book-batch', methods=['POST'])
-def convert_book_batch():
-    """Process a batch of book conversions one by one with status updates"""
-    try:
-        from utils.converter import convert_book, conversion_status
-        
-        data = request.get_json()
-        asin_list = data.get('asin_list', [])
-        current_index = data.get('current_index', 0)
-        results = data.get('results', {
-            'total': len(asin_list),
-            'converted': 0,
-            'failed': 0,
-            'failures': [],
-            'books': []
-        })
-        
-        # If all books processed, return final results
-        if current_index >= len(asin_list):
-            return jsonify({
-                'success': True,
-                'complete': True,
-                'results': results
-            })
-            
-        # Process the current book
-        asin = asin_list[current_index]
-        
-        # Get the book title for better logging
-        library = load_library()
-        book_title = library.get(asin, {}).get('amazon_title', 'Unknown')
-        
-        config.logger.info(f"Batch conversion {current_index+1}/{len(asin_list)}: {book_title} ({asin})")
-        
-        # Use the existing convert_book function
-        result = convert_book(asin)
-        
-        book_info = {
-            'asin': asin,
-            'title': book_title,
-            'index': current_index
-        }
-        
-        # Reload library to get updated file sizes
-        updated_library = load_library()
-        
-        if result['success']:
-            results['converted'] += 1
-            book_info['status'] = 'converted'
-            book_info['file'] = result.get('file', '')
-            
-            # Get updated file size from library
-            if asin in updated_library and updated_library[asin].get('m4b_size'):
-                book_info['size'] = updated_library[asin]['m4b_size']
-            else:
-                # If size not in library, try to get it from the file
-                if result.get('file') and os.path.exists(result['file']):
-                    book_info['size'] = os.path.getsize(result['file'])
-                else:
-                    book_info['size'] = 0
-        else:
-            results['failed'] += 1
-            book_info['status'] = 'failed'
-            book_info['error'] = result.get('error', 'Unknown error')
-            
-            results['failures'].append({
-                'asin': asin,
-                'title': book_title,
-                'error': result.get('error', 'Unknown error')
-            })
-            
-        results['books'].append(book_info)
-        
-        # Return progress update
-        return jsonify({
-            'success': True,
-            'complete': False,
-            'current_index': current_index + 1,
-            'asin_list': asin_list,
-            'current_book': book_info,
-            'results': results
-        })
-        
-    except Exception as e:
-        config.logger.error(f"Book conversion batch processing failed: {e}", exc_info=True)
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        })
-
 @app.route('/unlock-book', methods=['POST'])
 def unlock_book():
     """Remove locked status from a book"""
@@ -1146,16 +840,133 @@ def unlock_book():
         if not asin:
             return jsonify({'success': False, 'error': 'Missing ASIN'})
             
-        library = load_library()
-        if asin not in library:
-            return jsonify({'success': False, 'error': 'Book not found'})
-            
-        if 'locked' in library[asin]:
-            del library[asin]['locked']
-            save_library(library)
+        with library_transaction(asin) as book:
+            if book is None:
+                return jsonify({'success': False, 'error': 'Book not found'})
+
+            book.pop('locked', None)
             
         return jsonify({'success': True})
         
     except Exception as e:
         config.logger.error(f"Error unlocking book: {e}")
         return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/jobs', methods=['POST'])
+def submit_job_route():
+    """Queue a download or conversion job and return its ID immediately"""
+    try:
+        data = request.get_json() or {}
+        job_type = data.pop('type', None)
+        if job_type not in JOB_HANDLERS:
+            return jsonify({'success': False, 'error': f'Unknown job type: {job_type}'}), 400
+
+        job = submit_job(job_type, **data)
+        return jsonify({'success': True, 'job_id': job.id})
+
+    except ValueError as e:
+        # Unknown priority or parameters that don't fit the job type; nothing was queued
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        config.logger.error(f"Error submitting job: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/jobs')
+def list_jobs_route():
+    """List jobs, optionally filtered by ?state="""
+    jobs = get_job_queue().list(request.args.get('state'))
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
+@app.route('/scheduler')
+def scheduler_status_route():
+    """Running and pending job counts against the concurrency caps, plus the adaptive download window"""
+    status = get_job_queue().scheduler.status()
+    status['download_window'] = download_controller.status()
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>')
+def job_status_route(job_id):
+    """State and, once finished, result of a job"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_route(job_id):
+    """Cancel a queued or running job, killing its process and removing partial output"""
+    job = cancel_job(job_id)
+    if job is None:
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        return jsonify({'success': False, 'error': f'Job already {job.state}'}), 409
+    return jsonify({'success': True, 'job_id': job.id})
+
+@app.route('/events')
+def events_route():
+    """Server-Sent Events: job progress (bytes/sec, ETA), job state changes and library versions"""
+    subscription = event_bus.subscribe()
+    if subscription is None:
+        # Each stream holds a server thread; clients fall back to polling
+        return jsonify({'success': False, 'error': 'Too many event streams'}), 503
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            yield format_event('library', {'version': library_version()})
+            while True:
+                events = subscription.get(config.EVENTS_KEEPALIVE)
+                if not events:
+                    yield ': keepalive\n\n'
+                for event_type, data in events:
+                    yield format_event(event_type, data)
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/batches/<batch_id>')
+def batch_progress_route(batch_id):
+    """Batch counters plus the books finished after ?since=<sequence>"""
+    try:
+        since = request.args.get('since', 0, type=int)
+        progress = batch_progress(batch_id, since)
+        if progress is None:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        return jsonify(progress)
+
+    except Exception as e:
+        config.logger.error(f"Error reading batch {batch_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/batches/<batch_id>/cancel', methods=['POST'])
+def cancel_batch_route(batch_id):
+    """Cancel every job of a batch that hasn't finished yet"""
+    try:
+        cancelled = cancel_batch(batch_id)
+        if cancelled is None:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        return jsonify({'success': True, 'cancelled': cancelled})
+
+    except Exception as e:
+        config.logger.error(f"Error cancelling batch {batch_id}: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/batches/<batch_id>/results')
+def batch_results_route(batch_id):
+    """Page through a batch's per-book results (?offset, ?limit, ?status)"""
+    try:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        books = batch_results(batch_id, offset, limit, request.args.get('status'))
+        if books is None:
+            return jsonify({'success': False, 'error': 'Batch not found'}), 404
+        return jsonify({'success': True, 'books': books, 'offset': offset})
+
+    except Exception as e:
+        config.logger.error(f"Error reading batch {batch_id} results: {e}")
+        return jsonify({'success': False, 'error': str(e)})
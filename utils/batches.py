@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import config
+from utils.library import library_snapshot
+from utils.jobs import get_job_queue, add_job_listener, add_prune_listener, BULK
+from utils.events import event_bus
+
+# Batch kind -> (job type, name of the success counter the UI shows)
+BATCH_KINDS = {
+    'books': ('download_book', 'downloaded'),
+    'covers': ('download_cover', 'downloaded'),
+    'pdfs': ('download_pdf', 'downloaded'),
+    'convert': ('convert', 'converted'),
+}
+
+class BatchStore:
+    """Batches and their per-book results, kept in the jobs database
+
+    Each item records the job that processes it and, once that job finishes,
+    its outcome plus a per-batch completion sequence number so progress
+    queries can ask for just the items finished since their last poll.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.JOBS_DB
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS batches ('
+                'id TEXT PRIMARY KEY, kind TEXT NOT NULL, profile TEXT, total INTEGER NOT NULL, '
+                'succeeded INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, '
+                'locked_skipped INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS batch_items ('
+                'batch_id TEXT NOT NULL, idx INTEGER NOT NULL, asin TEXT NOT NULL, title TEXT, '
+                'job_id TEXT, status TEXT NOT NULL, info TEXT, done_seq INTEGER, '
+                'PRIMARY KEY (batch_id, idx))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS batch_items_job ON batch_items (job_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS batch_items_done ON batch_items (batch_id, done_seq)')
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, work):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+                conn.execute('COMMIT')
+                return result
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def create(self, batch_id, kind, profile, items, locked_skipped=0):
+        """items: [(asin, title, job_id)] in processing order"""
+        def work(conn):
+            conn.execute(
+                'INSERT INTO batches (id, kind, profile, total, locked_skipped, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (batch_id, kind, profile, len(items), locked_skipped, time.time())
+            )
+            conn.executemany(
+                "INSERT INTO batch_items (batch_id, idx, asin, title, job_id, status) VALUES (?, ?, ?, ?, ?, 'queued')",
+                [(batch_id, idx, asin, title, job_id) for idx, (asin, title, job_id) in enumerate(items)]
+            )
+        self._transaction(work)
+
+    def finish_item(self, job_id, status, info):
+        """Record a finished job's outcome against its batch item; returns the batch ID, or None"""
+        def work(conn):
+            row = conn.execute(
+                "SELECT batch_id, idx FROM batch_items WHERE job_id = ? AND done_seq IS NULL", (job_id,)
+            ).fetchone()
+            if not row:
+                return None
+            batch_id, idx = row
+            done = conn.execute(
+                'SELECT COALESCE(MAX(done_seq), 0) FROM batch_items WHERE batch_id = ?', (batch_id,)
+            ).fetchone()[0]
+            conn.execute(
+                'UPDATE batch_items SET status = ?, info = ?, done_seq = ? WHERE batch_id = ? AND idx = ?',
+                (status, json.dumps(info), done + 1, batch_id, idx)
+            )
+            counter = 'failed' if status == 'failed' else 'succeeded'
+            conn.execute(f'UPDATE batches SET {counter} = {counter} + 1 WHERE id = ?', (batch_id,))
+            return batch_id
+        return self._transaction(work)
+
+    def item_for_job(self, job_id):
+        """(batch kind, asin, title, index) of the item a job belongs to, or None"""
+        with self._lock:
+            return self._connect().execute(
+                'SELECT b.kind, i.asin, i.title, i.idx FROM batch_items i '
+                'JOIN batches b ON b.id = i.batch_id WHERE i.job_id = ?', (job_id,)
+            ).fetchone()
+
+    def unfinished_jobs(self, batch_id):
+        """IDs of the jobs behind items that haven't finished yet"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT job_id FROM batch_items WHERE batch_id = ? AND done_seq IS NULL', (batch_id,)
+            ).fetchall()
+        return [job_id for job_id, in rows]
+
+    def count_status(self, batch_id, status):
+        with self._lock:
+            return self._connect().execute(
+                'SELECT COUNT(*) FROM batch_items WHERE batch_id = ? AND status = ?', (batch_id, status)
+            ).fetchone()[0]
+
+    def get(self, batch_id):
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT id, kind, profile, total, succeeded, failed, locked_skipped, created_at FROM batches WHERE id = ?',
+                (batch_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(['id', 'kind', 'profile', 'total', 'succeeded', 'failed', 'locked_skipped', 'created_at'], row))
+
+    def finished_since(self, batch_id, since, limit):
+        """Items completed after sequence number `since`, in completion order"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT done_seq, info FROM batch_items WHERE batch_id = ? AND done_seq > ? ORDER BY done_seq LIMIT ?',
+                (batch_id, since, limit)
+            ).fetchall()
+        return [(seq, json.loads(info)) for seq, info in rows]
+
+    def items(self, batch_id, offset=0, limit=100, status=None):
+        """A page of a batch's items in processing order, optionally filtered by status"""
+        query = 'SELECT idx, asin, title, status, info FROM batch_items WHERE batch_id = ?'
+        args = [batch_id]
+        if status:
+            query += ' AND status = ?'
+            args.append(status)
+        query += ' ORDER BY idx LIMIT ? OFFSET ?'
+        args.extend([limit, offset])
+        with self._lock:
+            rows = self._connect().execute(query, args).fetchall()
+        return [
+            json.loads(info) if info else {'asin': asin, 'title': title, 'index': idx, 'status': status}
+            for idx, asin, title, status, info in rows
+        ]
+
+    def prune(self, before):
+        """Forget batches created before the given timestamp whose items have all finished"""
+        def work(conn):
+            ids = [batch_id for batch_id, in conn.execute(
+                'SELECT id FROM batches b WHERE created_at < ? AND NOT EXISTS '
+                '(SELECT 1 FROM batch_items i WHERE i.batch_id = b.id AND i.done_seq IS NULL)', (before,)
+            ).fetchall()]
+            conn.executemany('DELETE FROM batch_items WHERE batch_id = ?', [(batch_id,) for batch_id in ids])
+            conn.executemany('DELETE FROM batches WHERE id = ?', [(batch_id,) for batch_id in ids])
+            return len(ids)
+        return self._transaction(work)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_batch_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BatchStore()
+        return _store
+
+def create_batch(kind, profile, asins, locked_skipped=0, priority=BULK):
+    """Queue a job for every ASIN in the given lane and return the new batch's ID"""
+    job_type, _ = BATCH_KINDS[kind]
+    library = library_snapshot()
+    params = [{'asin': asin} if kind == 'convert' else {'profile': profile, 'asin': asin} for asin in asins]
+
+    batch_id = uuid.uuid4().hex
+    store = get_batch_store()
+    queue = get_job_queue()
+    # Record the batch before any job can finish so no completion goes unattributed
+    jobs = queue.submit_many(job_type, params, start=False, priority=priority)
+    store.create(batch_id, kind, profile, [
+        (asin, library.get(asin, {}).get('amazon_title', 'Unknown'), job.id)
+        for asin, job in zip(asins, jobs)
+    ], locked_skipped)
+    queue.start(jobs)
+    config.logger.info(f"Created {kind} batch {batch_id} with {len(asins)} books")
+    return batch_id
+
+def cancel_batch(batch_id):
+    """Cancel every unfinished job of a batch; returns how many were cancelled, or None"""
+    store = get_batch_store()
+    if store.get(batch_id) is None:
+        return None
+    queue = get_job_queue()
+    cancelled = sum(1 for job_id in store.unfinished_jobs(batch_id) if queue.cancel(job_id))
+    config.logger.info(f"Cancelled {cancelled} jobs of batch {batch_id}")
+    return cancelled
+
+def _item_info(kind, asin, title, index, result):
+    """Per-book summary shown in batch progress"""
+    info = {'asin': asin, 'title': title, 'index': index}
+    book = library_snapshot().get(asin, {})
+
+    if result.get('success'):
+        info['status'] = BATCH_KINDS[kind][1]
+        info['file'] = result.get('file', '')
+        if kind == 'covers':
+            if book.get('cover_path'):
+                info['cover_path'] = book['cover_path']
+        else:
+            size_field = {'convert': 'm4b_size', 'pdfs': 'pdf_size'}.get(kind, 'audible_size')
+            size = book.get(size_field)
+            if not size and info['file'] and os.path.exists(info['file']):
+                size = os.path.getsize(info['file'])
+            info['size'] = size or 0
+    elif kind == 'pdfs' and 'No PDF available' in result.get('error', ''):
+        # Not every book has a companion PDF; that isn't a failure
+        info['status'] = 'not_available'
+    else:
+        info['status'] = 'failed'
+        info['error'] = result.get('error', 'Unknown error')
+        if kind == 'books' and (result.get('status') == 'locked' or 'locked' in info['error'].lower()):
+            info['locked'] = True
+    return info
+
+def _on_job_finished(job):
+    store = get_batch_store()
+    item = store.item_for_job(job.id)
+    if item is None:
+        return
+    info = _item_info(*item, job.result or {'success': False, 'error': job.error})
+    batch_id = store.finish_item(job.id, info['status'], info)
+    if batch_id:
+        # Pages following the batch fetch its progress when an item finishes instead of polling blindly
+        event_bus.publish('batch', {'batch_id': batch_id}, batch_id)
+
+add_job_listener(_on_job_finished)
+
+def _prune_batches(before):
+    # Old batches point at jobs JobStore.prune has already forgotten
+    pruned = get_batch_store().prune(before)
+    if pruned:
+        config.logger.info(f"Pruned {pruned} finished batches")
+
+add_prune_listener(_prune_batches)
+
+def batch_progress(batch_id, since=0, limit=200):
+    """Counters plus the items finished since the caller's last poll"""
+    store = get_batch_store()
+    batch = store.get(batch_id)
+    if batch is None:
+        return None
+
+    finished = store.finished_since(batch_id, since, limit)
+    done = batch['succeeded'] + batch['failed']
+    results = {
+        'total': batch['total'],
+        BATCH_KINDS[batch['kind']][1]: batch['succeeded'],
+        'failed': batch['failed'],
+        'locked_skipped': batch['locked_skipped'],
+    }
+    if batch['kind'] == 'pdfs':
+        # Books without a PDF finish as successes; report them apart from real downloads
+        results['not_available'] = store.count_status(batch_id, 'not_available')
+        results['downloaded'] -= results['not_available']
+    return {
+        'success': True,
+        'batch_id': batch_id,
+        'kind': batch['kind'],
+        'profile': batch['profile'],
+        'results': results,
+        'books': [info for _, info in finished],
+        'since': finished[-1][0] if finished else since,
+        'complete': done >= batch['total'] and (not finished or finished[-1][0] >= done),
+    }
+
+def batch_results(batch_id, offset=0, limit=100, status=None):
+    """A page of per-book results, kept server-side for the life of the batch"""
+    store = get_batch_store()
+    if store.get(batch_id) is None:
+        return None
+    return store.items(batch_id, offset, limit, status)
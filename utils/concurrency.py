@@ -0,0 +1,143 @@
+import re
+import time
+import threading
+from collections import deque
+import config
+
+# stderr text from audible-cli/httpx that means Audible is throttling us
+THROTTLE_PATTERN = re.compile(r'\b429\b|too many requests|rate.?limit|throttl', re.IGNORECASE)
+
+_UNITS = {'': 1, 'k': 1e3, 'K': 1e3, 'M': 1e6, 'G': 1e9, 'T': 1e12}
+# tqdm progress amounts, e.g. " 13%|█▎     | 8.39M/64.5M [00:02<00:13, 4.19MB/s]"
+_PROGRESS_AMOUNT = re.compile(r'([\d.]+)\s*([kKMGT]?)i?B?/([\d.]+)\s*([kKMGT]?)i?B?\s*\[')
+
+def parse_progress_amounts(line):
+    """(bytes transferred, total bytes) from a tqdm progress line, or None"""
+    match = _PROGRESS_AMOUNT.search(line)
+    if not match:
+        return None
+    try:
+        return (float(match.group(1)) * _UNITS[match.group(2)],
+                float(match.group(3)) * _UNITS[match.group(4)])
+    except ValueError:
+        return None
+
+class TransferRate:
+    """Average transfer rate of one download, measured between its progress lines"""
+
+    def __init__(self):
+        self._first = None
+        self._last = None
+
+    def update(self, transferred, now=None):
+        sample = (time.monotonic() if now is None else now, transferred)
+        if self._first is None:
+            self._first = sample
+        self._last = sample
+
+    @property
+    def rate(self):
+        """Bytes per second, or None before two samples are far enough apart"""
+        if self._first is None or self._last[0] - self._first[0] < 1.0:
+            return None
+        return (self._last[1] - self._first[1]) / (self._last[0] - self._first[0])
+
+class AimdController:
+    """Additive-increase / multiplicative-decrease concurrency window
+
+    The window grows by one after a full window's worth of downloads finish
+    at a good rate while the window was actually full, and halves on a
+    timeout, throttling response or stall.
+    Decreases are spaced by a cooldown so one burst of failures from
+    downloads that were already running only counts once.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, enabled=True):
+        self.minimum = minimum
+        self.maximum = max(maximum or initial, initial)
+        self.enabled = enabled
+        self.window = float(max(minimum, min(initial, self.maximum)))
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._usage = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.history = deque(maxlen=50)
+
+    @property
+    def limit(self):
+        return int(self.window)
+
+    def add_listener(self, callback):
+        """Call callback() whenever the window changes"""
+        self._listeners.append(callback)
+
+    def set_usage(self, callback):
+        """callback() -> downloads running now; successes only grow the window while it is full"""
+        self._usage = callback
+
+    def _change(self, window, reason):
+        """Set a new window; caller holds _lock. Returns True if the limit moved"""
+        old = self.limit
+        self.window = max(self.minimum, min(window, self.maximum))
+        if self.limit == old:
+            return False
+        self.history.append({'time': time.time(), 'from': old, 'to': self.limit, 'reason': reason})
+        config.logger.info(f"Download concurrency {old} -> {self.limit}: {reason}")
+        return True
+
+    def _notify(self, changed):
+        if changed:
+            for callback in self._listeners:
+                callback()
+
+    def record_success(self, rate=None):
+        """A download finished; rate is its bytes/sec when known"""
+        if not self.enabled:
+            return
+        if rate is not None and rate < config.DOWNLOAD_GOOD_RATE:
+            return
+        # A window with spare slots says nothing about whether a bigger one would be safe
+        if self._usage is not None and self._usage() < self.limit:
+            return
+        with self._lock:
+            self._successes += 1
+            changed = False
+            if self._successes >= self.limit:
+                self._successes = 0
+                reason = f"{self.limit} downloads succeeded"
+                if rate is not None:
+                    reason += f" (last at {rate / 1e6:.1f} MB/s)"
+                changed = self._change(self.window + 1, reason)
+        self._notify(changed)
+
+    def record_backoff(self, reason):
+        """A download timed out, was throttled or stalled"""
+        if not self.enabled:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._successes = 0
+            if now - self._last_decrease < config.DOWNLOAD_BACKOFF_COOLDOWN:
+                return
+            self._last_decrease = now
+            changed = self._change(self.window / 2, reason)
+        self._notify(changed)
+
+    def status(self):
+        with self._lock:
+            return {
+                'adaptive': self.enabled,
+                'window': self.limit,
+                'minimum': self.minimum,
+                'maximum': self.maximum,
+                'changes': list(self.history),
+            }
+
+# Shared by the download code (which reports signals) and the job scheduler (which obeys the limit)
+download_controller = AimdController(
+    config.DOWNLOAD_CONCURRENCY,
+    # Growing past the workers that can run downloads would only blunt later decreases
+    maximum=min(config.DOWNLOAD_MAX_CONCURRENCY, config.JOB_WORKERS),
+    enabled=config.DOWNLOAD_ADAPTIVE
+)
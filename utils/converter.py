@@ -3,21 +3,36 @@ import time
 import os
 import re
 import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import config
-from utils.library import load_library, save_library
+from utils.library import library_snapshot, library_transaction, thaw
+from utils.process import run_process, cancel_scope, current_cancel_token
+from utils.events import event_bus
+from utils.workspace import create_workspace
 
 conversion_status = {}
 
 def convert_book(asin):
     """Convert a book to M4B format with cover image embedding"""
+    result = _convert_book(asin)
+    status = conversion_status.get(asin)
+    # Early returns (no profile, activation bytes, voucher, ...) leave the state open; close it here
+    if isinstance(status, dict) and status['state'] == 'converting':
+        _set_conversion_state(asin, 'completed' if result['success'] else 'failed', result.get('error'))
+    return result
+
+def _convert_book(asin):
+    workspace = None
     try:
-        library = load_library()
-        if asin not in library:
+        book = library_snapshot().get(asin)
+        if book is None:
             config.logger.error(f"Book not found in library: {asin}")
             return {'success': False, 'error': 'Book not found'}
 
-        book = library[asin]
+        book = thaw(book)
         book_title = book.get('amazon_title', 'Unknown Title')
 
         if not book.get('audible_file'):
@@ -58,13 +73,24 @@ def convert_book(asin):
                 output_file.unlink()
             else:
                 config.logger.info(f"Existing M4B file found for '{book_title}': {output_file}")
-                library[asin]['m4b_file'] = str(output_file)
-                library[asin]['m4b_size'] = m4b_size
-                save_library(library)
+                with library_transaction(asin) as entry:
+                    if entry is not None:
+                        entry['m4b_file'] = str(output_file)
+                        entry['m4b_size'] = m4b_size
                 return {'success': True, 'file': str(output_file)}
 
-        conversion_status[asin] = 'converting'
+        _set_conversion_state(asin, 'converting')
         config.logger.info(f"Starting conversion for '{book_title}'")
+        # Per-step ffmpeg stats, returned so the job result keeps the throughput history
+        throughput = []
+
+        # ffmpeg writes into a private workspace; the finished book is renamed into place.
+        # A remux is about the size of its source, and scratch-file concatenation holds parts twice.
+        multi_part_sources = is_multi_part and has_parts
+        sources = [part['file_path'] for part in book['parts']] if multi_part_sources else [book['audible_file']]
+        source_size = sum(os.path.getsize(source) for source in sources if os.path.exists(source))
+        workspace = create_workspace(asin, source_size * (2 if multi_part_sources else 1))
+        temp_output = Path(workspace.file(output_file.name))
 
         # Check if we have a cover image
         cover_path = book.get('cover_path')
@@ -97,102 +123,13 @@ def convert_book(asin):
                     config.logger.error(error_msg)
                     return {'success': False, 'error': error_msg}
                 
-                # Alternative approach: Process each AAX file to temporary m4a files while preserving the audio codec
-                import os
-                
-                # Create temporary directory for intermediate files
-                temp_dir = config.TMP_DIR
-                temp_files = []
-                
+                decrypt_args = ['-activation_bytes', activation_bytes]
+
                 config.logger.info(f"Processing {len(book['parts'])} parts for multi-part book '{book_title}'")
-                
-                # Process each part separately
-                for i, part in enumerate(sorted(book['parts'], key=lambda p: os.path.basename(p['file_path']))):
-                    part_file = part['file_path']
-                    temp_output = os.path.join(temp_dir, f"temp_part_{i}_{asin}.m4a")
-                    
-                    # Decode each part to m4a while preserving the original audio codec
-                    decode_cmd = [
-                        'ffmpeg', '-y',
-                        '-activation_bytes', activation_bytes,
-                        '-i', part_file,
-                        '-c:a', 'copy',  # Copy audio stream to preserve quality
-                        '-vn',  # No video
-                        temp_output
-                    ]
-                    
-                    config.logger.info(f"Decoding part {i+1}/{len(book['parts'])}: {os.path.basename(part_file)}")
-                    part_result = run_ffmpeg_conversion(decode_cmd)
-                    
-                    if not part_result['success']:
-                        config.logger.error(f"Failed to decode part {i+1}: {part_result['error']}")
-                        # Clean up temporary files
-                        for tf in temp_files:
-                            try:
-                                os.unlink(tf)
-                            except:
-                                pass
-                        return {'success': False, 'error': f"Failed to decode part {i+1}"}
-                    
-                    temp_files.append(temp_output)
-                
-                # Create concat file for the decoded parts
-                concat_file = os.path.join(temp_dir, f"concat_decoded_{asin}.txt")
-                with open(concat_file, 'w') as f:
-                    for temp_file in temp_files:
-                        f.write(f"file '{temp_file}'\n")
-                
-                # Concatenate decoded parts into final m4b
-                if has_cover:
-                    concat_cmd = [
-                        'ffmpeg', '-y',
-                        '-f', 'concat',
-                        '-safe', '0',
-                        '-i', concat_file,
-                        '-i', cover_path,
-                        '-map', '0:a',
-                        '-map', '1:v',
-                        '-c:a', 'copy',  # Preserve audio codec
-                        '-c:v', 'copy',
-                        '-id3v2_version', '3',
-                        '-metadata:s:v', 'title="Album cover"',
-                        '-metadata:s:v', 'comment="Cover (front)"',
-                        '-disposition:v', 'attached_pic',
-                        str(output_file)
-                    ]
-                else:
-                    concat_cmd = [
-                        'ffmpeg', '-y',
-                        '-f', 'concat',
-                        '-safe', '0',
-                        '-i', concat_file,
-                        '-c:a', 'copy',  # Preserve audio codec
-                        str(output_file)
-                    ]
-                
-                config.logger.info(f"Concatenating {len(temp_files)} decoded parts into final M4B")
-                result = run_ffmpeg_conversion(concat_cmd)
-                
-                # Clean up temporary files
-                try:
-                    os.unlink(concat_file)
-                    for tf in temp_files:
-                        os.unlink(tf)
-                except Exception as e:
-                    config.logger.warning(f"Error cleaning up temp files: {e}")
-                
-                # Return early as we've already done the conversion
-                if result['success']:
-                    library[asin]['m4b_file'] = str(output_file)
-                    library[asin]['m4b_size'] = output_file.stat().st_size
-                    save_library(library)
-                    conversion_status[asin] = 'completed'
-                    return {'success': True, 'file': str(output_file)}
-                else:
-                    conversion_status[asin] = 'failed'
-                    error_msg = f"Concatenation failed: {result['error']}"
-                    config.logger.error(error_msg)
-                    return {'success': False, 'error': result['error']}
+                parts = sorted(book['parts'], key=lambda p: os.path.basename(p['file_path']))
+                durations = _part_durations(book, parts, decrypt_args)
+                result = _concat_parts(asin, parts, decrypt_args, durations, temp_output,
+                                       cover_path if has_cover else None, workspace.path, throughput)
             
             elif book['audible_format'] == 'aaxc':
                 # Handle AAXC files with voucher
@@ -213,103 +150,13 @@ def convert_book(asin):
                     config.logger.error(error_msg)
                     return {'success': False, 'error': error_msg}
 
-                # Similar approach for AAXC - decode parts first, then concatenate
-                import os
-                
-                # Create temporary directory for intermediate files
-                temp_dir = config.TMP_DIR
-                temp_files = []
-                
+                decrypt_args = ['-audible_key', key, '-audible_iv', iv]
+
                 config.logger.info(f"Processing {len(book['parts'])} parts for multi-part book '{book_title}'")
-                
-                # Process each part separately
-                for i, part in enumerate(sorted(book['parts'], key=lambda p: os.path.basename(p['file_path']))):
-                    part_file = part['file_path']
-                    temp_output = os.path.join(temp_dir, f"temp_part_{i}_{asin}.m4a")
-                    
-                    # Decode each part to m4a while preserving the original audio codec
-                    decode_cmd = [
-                        'ffmpeg', '-y',
-                        '-audible_key', key,
-                        '-audible_iv', iv,
-                        '-i', part_file,
-                        '-c:a', 'copy',  # Copy audio stream to preserve quality
-                        '-vn',  # No video
-                        temp_output
-                    ]
-                    
-                    config.logger.info(f"Decoding part {i+1}/{len(book['parts'])}: {os.path.basename(part_file)}")
-                    part_result = run_ffmpeg_conversion(decode_cmd)
-                    
-                    if not part_result['success']:
-                        config.logger.error(f"Failed to decode part {i+1}: {part_result['error']}")
-                        # Clean up temporary files
-                        for tf in temp_files:
-                            try:
-                                os.unlink(tf)
-                            except:
-                                pass
-                        return {'success': False, 'error': f"Failed to decode part {i+1}"}
-                    
-                    temp_files.append(temp_output)
-                
-                # Create concat file for the decoded parts
-                concat_file = os.path.join(temp_dir, f"concat_decoded_{asin}.txt")
-                with open(concat_file, 'w') as f:
-                    for temp_file in temp_files:
-                        f.write(f"file '{temp_file}'\n")
-                
-                # Concatenate decoded parts into final m4b
-                if has_cover:
-                    concat_cmd = [
-                        'ffmpeg', '-y',
-                        '-f', 'concat',
-                        '-safe', '0',
-                        '-i', concat_file,
-                        '-i', cover_path,
-                        '-map', '0:a',
-                        '-map', '1:v',
-                        '-c:a', 'copy',
-                        '-c:v', 'copy',
-                        '-id3v2_version', '3',
-                        '-metadata:s:v', 'title="Album cover"',
-                        '-metadata:s:v', 'comment="Cover (front)"',
-                        '-disposition:v', 'attached_pic',
-                        str(output_file)
-                    ]
-                else:
-                    concat_cmd = [
-                        'ffmpeg', '-y',
-                        '-f', 'concat',
-                        '-safe', '0',
-                        '-i', concat_file,
-                        '-c:a', 'copy',
-                        str(output_file)
-                    ]
-                
-                config.logger.info(f"Concatenating {len(temp_files)} decoded parts into final M4B")
-                result = run_ffmpeg_conversion(concat_cmd)
-                
-                # Clean up temporary files
-                try:
-                    os.unlink(concat_file)
-                    for tf in temp_files:
-                        os.unlink(tf)
-                except Exception as e:
-                    config.logger.warning(f"Error cleaning up temp files: {e}")
-                
-                # Return early as we've already done the conversion
-                if result['success']:
-                    library[asin]['m4b_file'] = str(output_file)
-                    library[asin]['m4b_size'] = output_file.stat().st_size
-                    save_library(library)
-                    conversion_status[asin] = 'completed'
-                    return {'success': True, 'file': str(output_file)}
-                else:
-                    conversion_status[asin] = 'failed'
-                    error_msg = f"Concatenation failed: {result['error']}"
-                    config.logger.error(error_msg)
-                    return {'success': False, 'error': result['error']}
+                parts = sorted(book['parts'], key=lambda p: os.path.basename(p['file_path']))
+                durations = _part_durations(book, parts, decrypt_args)
+                result = _concat_parts(asin, parts, decrypt_args, durations, temp_output,
+                                       cover_path if has_cover else None, workspace.path, throughput)
         # Handle single part books
         else:
             # Handle AAX files with activation bytes
@@ -332,6 +179,7 @@ def convert_book(asin):
                     return {'success': False, 'error': error_msg}
 
                 config.logger.debug(f"Using activation bytes for conversion")
+                decrypt_args = ['-activation_bytes', activation_bytes]
                 
                 # Use ffmpeg with cover image if available
                 if has_cover:
@@ -348,7 +196,7 @@ def convert_book(asin):
                         '-metadata:s:v', 'title="Album cover"',
                         '-metadata:s:v', 'comment="Cover (front)"',
                         '-disposition:v', 'attached_pic',
-                        str(output_file)
+                        str(temp_output)
                     ]
                 else:
                     cmd = [
@@ -358,10 +206,12 @@ def convert_book(asin):
                         '-c:a', 'copy', 
                         '-c:s', 'copy', 
                         '-c:v', 'copy',
-                        str(output_file)
+                        str(temp_output)
                     ]
                 
-                result = run_ffmpeg_conversion(cmd)
+                result = run_ffmpeg_conversion(cmd, asin, _book_duration(book, book['audible_file'], decrypt_args))
+                if 'stats' in result:
+                    throughput.append(result['stats'])
                 
             elif book['audible_format'] == 'aaxc':
                 # Handle AAXC files with voucher
@@ -382,6 +232,7 @@ def convert_book(asin):
                     config.logger.error(error_msg)
                     return {'success': False, 'error': error_msg}
 
+                decrypt_args = ['-audible_key', key, '-audible_iv', iv]
                 if has_cover:
                     cmd = [
                         'ffmpeg', '-y',
@@ -397,7 +248,7 @@ def convert_book(asin):
                         '-metadata:s:v', 'title="Album cover"',
                         '-metadata:s:v', 'comment="Cover (front)"',
                         '-disposition:v', 'attached_pic',
-                        str(output_file)
+                        str(temp_output)
                     ]
                 else:
                     cmd = [
@@ -408,31 +259,223 @@ def convert_book(asin):
                         '-c:a', 'copy', 
                         '-c:s', 'copy', 
                         '-c:v', 'copy',
-                        str(output_file)
+                        str(temp_output)
                     ]
                     
-                result = run_ffmpeg_conversion(cmd)
+                result = run_ffmpeg_conversion(cmd, asin, _book_duration(book, book['audible_file'], decrypt_args))
+                if 'stats' in result:
+                    throughput.append(result['stats'])
             else:
                 error_msg = f"Unsupported format: {book['audible_format']}"
                 config.logger.error(error_msg)
                 return {'success': False, 'error': error_msg}
 
         if result['success']:
-            library[asin]['m4b_file'] = str(output_file)
-            library[asin]['m4b_size'] = output_file.stat().st_size
-            save_library(library)
-            conversion_status[asin] = 'completed'
-            return {'success': True, 'file': str(output_file)}
+            workspace.publish(temp_output, output_file)
+            with library_transaction(asin) as entry:
+                if entry is not None:
+                    entry['m4b_file'] = str(output_file)
+                    entry['m4b_size'] = output_file.stat().st_size
+            _set_conversion_state(asin, 'completed')
+            return {'success': True, 'file': str(output_file), 'throughput': throughput}
         else:
-            conversion_status[asin] = 'failed'
+            _set_conversion_state(asin, 'failed', result['error'])
             error_msg = f"Conversion failed: {result['error']}"
             config.logger.error(error_msg)
-            return {'success': False, 'error': result['error']}
+            return {'success': False, 'error': result['error'], 'throughput': throughput}
 
     except Exception as e:
-        conversion_status[asin] = 'failed'
+        _set_conversion_state(asin, 'failed', str(e))
         config.logger.error(f"Conversion failed: {e}", exc_info=True)
         return {'success': False, 'error': str(e)}
+    finally:
+        # Success, failure or cancellation: nothing is left behind in scratch space
+        if workspace is not None:
+            workspace.cleanup()
+
+def _mux_command(input_args, output_file, cover_path=None, audio_args=()):
+    """ffmpeg command muxing the audio of input_args, plus the cover if given, into output_file"""
+    cmd = ['ffmpeg', '-y', *input_args]
+    if cover_path:
+        cmd += [
+            '-i', cover_path,
+            '-map', '0:a',
+            '-map', '1:v',
+            '-c:a', 'copy',  # Preserve audio codec
+            *audio_args,
+            '-c:v', 'copy',
+            '-id3v2_version', '3',
+            '-metadata:s:v', 'title="Album cover"',
+            '-metadata:s:v', 'comment="Cover (front)"',
+            '-disposition:v', 'attached_pic',
+        ]
+    else:
+        cmd += ['-c:a', 'copy', *audio_args]  # Preserve audio codec
+    return cmd + [str(output_file)]
+
+def _concat_parts(asin, parts, decrypt_args, durations, output_file, cover_path, scratch_dir, throughput):
+    """Join a multi-part book's parts into output_file as MULTIPART_CONCAT_MODE says
+
+    Streaming failures other than cancellation are retried through scratch
+    files, which also handles parts whose audio can't be carried as ADTS.
+    """
+    if config.MULTIPART_CONCAT_MODE == 'stream':
+        result = _stream_concat(asin, parts, decrypt_args, durations, output_file, cover_path, throughput)
+        token = current_cancel_token()
+        if result['success'] or (token is not None and token.cancelled):
+            return result
+        config.logger.warning(f"Streaming concatenation failed ({result['error']}), retrying with scratch files")
+        _remove_partial_output(output_file)
+    return _scratch_concat(asin, parts, decrypt_args, durations, output_file, cover_path, scratch_dir, throughput)
+
+def _stream_concat(asin, parts, decrypt_args, durations, output_file, cover_path, throughput):
+    """Pipe each part's decrypted audio as ADTS straight into the final mux, writing every byte once
+
+    Parts are decoded one after another into a single pipe that the muxing
+    ffmpeg reads as one continuous AAC stream.
+    """
+    read_fd, write_fd = os.pipe()
+    mux_cmd = _mux_command(['-f', 'aac', '-i', 'pipe:0'], output_file, cover_path, ['-bsf:a', 'aac_adtstoasc'])
+    token = current_cancel_token()
+    mux = {}
+
+    def run_mux():
+        with cancel_scope(token):
+            mux['result'] = run_ffmpeg_conversion(mux_cmd, asin, sum(d or 0 for d in durations) or None,
+                                                  'stream', stdin=read_fd)
+
+    config.logger.info(f"Streaming {len(parts)} decoded parts into final M4B")
+    mux_thread = threading.Thread(target=run_mux, name=f"mux-{asin}", daemon=True)
+    mux_thread.start()
+    error = None
+    try:
+        for i, part in enumerate(parts):
+            decode_cmd = [
+                'ffmpeg', '-nostdin', '-v', 'error',
+                *decrypt_args,
+                '-i', part['file_path'],
+                '-vn',
+                '-c:a', 'copy',
+                '-f', 'adts', 'pipe:1'
+            ]
+            config.logger.info(f"Decoding part {i+1}/{len(parts)}: {os.path.basename(part['file_path'])}")
+            part_result = run_process(decode_cmd, stdout=write_fd)
+            throughput.append(dict(part_result.stats(), step=f"part {i+1}/{len(parts)}"))
+            if not part_result.success:
+                error = f"Failed to decode part {i+1}: {part_result.killed or part_result.stderr}"
+                break
+    except Exception as e:
+        error = str(e)
+    finally:
+        # EOF lets the mux finish; after a failure its output is discarded
+        os.close(write_fd)
+        mux_thread.join()
+
+    result = mux['result']
+    if 'stats' in result:
+        throughput.append(result['stats'])
+    if error and result['success']:
+        config.logger.error(error)
+        return {'success': False, 'error': error}
+    return result
+
+def _scratch_concat(asin, parts, decrypt_args, durations, output_file, cover_path, temp_dir, throughput):
+    """Decode the parts to files in temp_dir, then concatenate those"""
+
+    # Decode the parts concurrently; concatenation starts once all of them are done
+    decoded = _decode_parts(asin, parts, decrypt_args, durations, temp_dir)
+    throughput.extend(decoded['stats'])
+    if not decoded['success']:
+        return {'success': False, 'error': decoded['error']}
+    temp_files = decoded['files']
+
+    # Create concat file for the decoded parts
+    concat_file = os.path.join(temp_dir, f"concat_decoded_{asin}.txt")
+    with open(concat_file, 'w') as f:
+        for temp_file in temp_files:
+            f.write(f"file '{temp_file}'\n")
+
+    concat_cmd = _mux_command(['-f', 'concat', '-safe', '0', '-i', concat_file], output_file, cover_path)
+    config.logger.info(f"Concatenating {len(temp_files)} decoded parts into final M4B")
+    result = run_ffmpeg_conversion(concat_cmd, asin, sum(d or 0 for d in durations) or None, 'concat')
+    if 'stats' in result:
+        throughput.append(result['stats'])
+
+    # Clean up temporary files
+    try:
+        os.unlink(concat_file)
+        for tf in temp_files:
+            os.unlink(tf)
+    except Exception as e:
+        config.logger.warning(f"Error cleaning up temp files: {e}")
+    return result
+
+def _decode_parts(asin, parts, decrypt_args, durations, temp_dir):
+    """Decrypt and remux each part to its own m4a, up to PART_DECODE_CONCURRENCY at a time
+
+    Returns {'success', 'files' (in part order), 'stats', 'error'}. Once a
+    part fails no further parts are started, and every part file written
+    so far is removed.
+    """
+    token = current_cancel_token()
+    group = ProgressGroup(sum(d or 0 for d in durations) or None, f"{len(parts)} parts")
+    temp_files = [os.path.join(temp_dir, f"temp_part_{i}_{asin}.m4a") for i in range(len(parts))]
+
+    def decode(i):
+        part_file = parts[i]['file_path']
+        # Decode each part to m4a while preserving the original audio codec
+        decode_cmd = [
+            'ffmpeg', '-y',
+            *decrypt_args,
+            '-i', part_file,
+            '-c:a', 'copy',  # Copy audio stream to preserve quality
+            '-vn',  # No video
+            temp_files[i]
+        ]
+        config.logger.info(f"Decoding part {i+1}/{len(parts)}: {os.path.basename(part_file)}")
+        # Worker threads don't inherit the job's cancel scope
+        with cancel_scope(token):
+            return run_ffmpeg_conversion(decode_cmd, asin, durations[i], f"part {i+1}/{len(parts)}", group)
+
+    stats = []
+    error = None
+    workers = max(1, min(config.PART_DECODE_CONCURRENCY, len(parts)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(decode, i): i for i in range(len(parts))}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                part_result = future.result()
+            except Exception as e:
+                part_result = {'success': False, 'error': str(e)}
+            if 'stats' in part_result:
+                stats.append((i, part_result['stats']))
+            if not part_result['success'] and error is None:
+                config.logger.error(f"Failed to decode part {i+1}: {part_result['error']}")
+                error = f"Failed to decode part {i+1}"
+                for pending in futures:
+                    pending.cancel()
+
+    stats = [part_stats for _, part_stats in sorted(stats, key=lambda item: item[0])]
+    if error:
+        # Clean up temporary files, including failed parts' partial output
+        for tf in temp_files:
+            try:
+                os.unlink(tf)
+            except OSError:
+                pass
+        return {'success': False, 'error': error, 'stats': stats}
+    return {'success': True, 'files': temp_files, 'stats': stats}
+
+def _remove_partial_output(output_file):
+    """Delete what a failed or cancelled ffmpeg run left at the output path"""
+    try:
+        output_file.unlink()
+        config.logger.info(f"Removed partial output {output_file}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        config.logger.warning(f"Could not remove partial output {output_file}: {e}")
 
 def get_activation_bytes_clean(profile_name):
     """Get activation bytes for a profile from disk or fetch and save them - clean implementation"""
@@ -488,68 +531,249 @@ def get_activation_bytes_clean(profile_name):
         return None
 
 
-def run_ffmpeg_conversion(command):
-    """Run ffmpeg conversion with clean logging and error handling"""
+def probe_duration(path, decrypt_args=()):
+    """Duration of a media file in seconds according to ffprobe, or None"""
     try:
-        # Log minimal information about the command
-        cmd_name = command[0] if isinstance(command, list) else command.split()[0]
-        config.logger.info(f"Starting {cmd_name} conversion process")
-        
-        # Create process 
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1  # Line buffered
+        result = run_process(
+            ['ffprobe', '-v', 'error', *decrypt_args, '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', str(path)],
+            timeout=60
         )
-        
-        # Track progress
-        last_progress = 0
-        start_time = time.time()
-        
-        stderr_output = ""
-        # Read stderr in real-time to capture progress
-        for line in iter(process.stderr.readline, ''):
-            stderr_output += line
-            # Only log progress at 10% intervals
-            if 'time=' in line and 'bitrate=' in line:
-                # For duration-based progress, need to parse duration and current time
-                duration_match = re.search(r'Duration: (\d+):(\d+):(\d+)', line)
-                time_match = re.search(r'time=(\d+):(\d+):(\d+)', line)
-                
-                if duration_match and time_match:
-                    h1, m1, s1 = map(int, duration_match.groups())
-                    h2, m2, s2 = map(int, time_match.groups())
-                    
-                    total_seconds = h1*3600 + m1*60 + s1
-                    current_seconds = h2*3600 + m2*60 + s2
-                    
-                    if total_seconds > 0:
-                        progress = int(current_seconds / total_seconds * 100)
-                        
-                        # Only log at 10% intervals or at 100%
-                        if progress >= last_progress + 10 or progress == 100:
-                            config.logger.info(f"Conversion progress: {progress}%")
-                            last_progress = progress // 10 * 10  # Round down to nearest 10
-            
+        return float(result.stdout.strip().splitlines()[-1]) if result.success else None
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _book_duration(book, path, decrypt_args):
+    """Probed duration of a source file, falling back to the library's runtime_minutes"""
+    duration = probe_duration(path, decrypt_args)
+    if duration:
+        return duration
+    try:
+        return float(book.get('runtime_minutes') or 0) * 60 or None
+    except (TypeError, ValueError):
+        return None
+
+def _part_durations(book, parts, decrypt_args):
+    """Probed duration of each part; unprobeable parts get a size-weighted share of runtime_minutes"""
+    durations = [probe_duration(part['file_path'], decrypt_args) for part in parts]
+    if all(durations):
+        return durations
+    try:
+        runtime = float(book.get('runtime_minutes') or 0) * 60
+    except (TypeError, ValueError):
+        runtime = 0
+    sizes = [os.path.getsize(part['file_path']) if os.path.exists(part['file_path']) else 0 for part in parts]
+    total_size = sum(sizes)
+    return [
+        duration or (runtime * size / total_size if total_size else None)
+        for duration, size in zip(durations, sizes)
+    ]
+
+def _set_conversion_state(asin, state, error=None):
+    """Record a conversion's state and, for failures, why; a new conversion starts with fresh progress fields"""
+    status = conversion_status.get(asin)
+    if state == 'converting' or not isinstance(status, dict):
+        status = conversion_status[asin] = {
+            'percent': 0, 'speed': None, 'eta': None, 'step': None,
+            'history': deque(maxlen=config.CONVERSION_HISTORY_SAMPLES)
+        }
+    status['state'] = state
+    status['error'] = error
+    if state == 'completed':
+        status.update(percent=100, eta=0)
+    status['updated_at'] = time.time()
+
+def conversion_progress(asin):
+    """JSON-safe copy of a book's conversion status, or None if it hasn't been converted here"""
+    status = conversion_status.get(asin)
+    if not isinstance(status, dict):
+        return None
+    return dict(status, history=list(status['history']))
+
+class FfmpegProgress:
+    """Turns ffmpeg -progress key=value blocks into percent, speed and ETA"""
+
+    def __init__(self, duration=None, step=None, history=None):
+        self.duration = duration
+        self.step = step
+        self.history = history
+        self.start = time.monotonic()
+        self.media_seconds = 0.0
+        self.bytes = 0
+        self.speed = None
+        self.samples = deque(maxlen=config.CONVERSION_HISTORY_SAMPLES)
+        self.logged = 0
+        self._block = {}
+        self._last_sample = None
+
+    def feed(self, line):
+        """Consume one stdout line; returns True when a progress block completed"""
+        key, sep, value = line.partition('=')
+        if not sep:
+            return False
+        self._block[key.strip()] = value.strip()
+        if key.strip() != 'progress':
+            return False
+
+        block, self._block = self._block, {}
+        try:
+            self.media_seconds = max(int(block.get('out_time_us', 'N/A')) / 1e6, 0.0)
+        except ValueError:
+            pass
+        try:
+            self.bytes = int(block.get('total_size', 'N/A'))
+        except ValueError:
+            pass
+        reported = block.get('speed', 'N/A').rstrip('x')
+        try:
+            self.speed = float(reported)
+        except ValueError:
+            elapsed = self.elapsed
+            self.speed = self.media_seconds / elapsed if elapsed > 0 else None
+
+        now = time.monotonic()
+        if (self._last_sample is None or block.get('progress') == 'end'
+                or now - self._last_sample >= config.CONVERSION_HISTORY_INTERVAL):
+            self._last_sample = now
+            sample = {
+                'step': self.step,
+                'elapsed': round(self.elapsed, 1),
+                'media_seconds': round(self.media_seconds, 1),
+                'bytes': self.bytes,
+                'speed': self.speed,
+            }
+            self.samples.append(sample)
+            if self.history is not None:
+                self.history.append(sample)
+        return True
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    @property
+    def percent(self):
+        if not self.duration:
+            return None
+        return round(min(self.media_seconds / self.duration, 1.0) * 100, 1)
+
+    @property
+    def eta(self):
+        """Seconds left at the average speed so far, which is steadier than ffmpeg's instantaneous one"""
+        elapsed = self.elapsed
+        if not self.duration or not self.media_seconds or elapsed <= 0:
+            return None
+        realtime = self.media_seconds / elapsed
+        return round(max(self.duration - self.media_seconds, 0) / realtime)
+
+    def snapshot(self):
+        elapsed = self.elapsed
+        return {
+            'percent': self.percent,
+            'speed': self.speed,
+            'eta': self.eta,
+            'bytes': self.bytes,
+            'rate': round(self.bytes / elapsed) if elapsed > 0 else None,
+        }
+
+class ProgressGroup:
+    """Combined progress of ffmpeg runs working on one output concurrently, such as part decodes"""
+
+    def __init__(self, duration=None, step=None):
+        self.duration = duration
+        self.step = step
+        self.start = time.monotonic()
+        self.members = []
+        self.logged = 0
+        self._lock = threading.Lock()
+
+    def add(self, progress):
+        with self._lock:
+            self.members.append(progress)
+
+    def snapshot(self):
+        with self._lock:
+            members = list(self.members)
+        media_seconds = sum(p.media_seconds for p in members)
+        total_bytes = sum(p.bytes for p in members)
+        elapsed = time.monotonic() - self.start
+        # Concurrent runs add up: two parts at 30x each convert 60 seconds of audio per second
+        speed = sum(p.speed or 0 for p in members if p.media_seconds < (p.duration or float('inf'))) or None
+        snapshot = {'percent': None, 'speed': speed, 'eta': None, 'bytes': total_bytes,
+                    'rate': round(total_bytes / elapsed) if elapsed > 0 else None}
+        if self.duration:
+            snapshot['percent'] = round(min(media_seconds / self.duration, 1.0) * 100, 1)
+            if media_seconds and elapsed > 0:
+                snapshot['eta'] = round(max(self.duration - media_seconds, 0) / (media_seconds / elapsed))
+        return snapshot
+
+def run_ffmpeg_conversion(command, asin=None, duration=None, step=None, group=None, stdin=None):
+    """Run ffmpeg with machine-readable progress, publishing percent/speed/ETA for asin
+
+    duration is the media length in seconds the output will cover; without
+    it the input's Duration line is used. Runs sharing a ProgressGroup
+    publish their combined progress. stdin is an optional pipe fd to read
+    from (see run_process). Returns the usual result dict plus
+    'stats' with resource usage and sampled throughput.
+    """
+    try:
+        # Log minimal information about the command
+        cmd_name = command[0]
+        config.logger.info(f"Starting {cmd_name} conversion process{f' ({step})' if step else ''}")
+        command = [command[0], '-progress', 'pipe:1', '-nostats'] + list(command[1:])
+
+        status = conversion_status.get(asin) if asin else None
+        if not isinstance(status, dict):
+            status = None
+        progress = FfmpegProgress(duration, step, status['history'] if status else None)
+        tracker = group or progress
+        if group:
+            group.add(progress)
+        if status:
+            status.update(step=tracker.step, percent=0 if group is None else status['percent'], eta=None)
+
+        def on_stdout(line):
+            if not progress.feed(line):
+                return
+            snapshot = tracker.snapshot()
+            if status:
+                status.update(snapshot, updated_at=time.time())
+            if asin:
+                event_bus.publish_progress(asin, dict(snapshot, asin=asin, kind='convert', step=tracker.step))
+
+            # Only log at 10% intervals
+            percent = snapshot['percent']
+            if percent is not None and percent >= tracker.logged + 10:
+                tracker.logged = percent // 10 * 10
+                speed = f" at {snapshot['speed']:.1f}x" if snapshot['speed'] else ''
+                config.logger.info(f"Conversion progress: {percent:.0f}%{speed}")
+
+        def on_stderr(line):
+            # Fallback total when the caller couldn't tell us the duration
+            if progress.duration is None:
+                duration_match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', line)
+                if duration_match:
+                    h, m, s = duration_match.groups()
+                    progress.duration = int(h) * 3600 + int(m) * 60 + float(s)
+                    return
             # Log errors
-            elif 'error' in line.lower() or 'failed' in line.lower():
-                config.logger.error(f"FFmpeg error: {line.strip()}")
-        
-        # Get return code
-        process.wait()
-        
-        elapsed = time.time() - start_time
-        config.logger.info(f"Conversion completed in {elapsed:.1f} seconds with status: {process.returncode}")
-        
-        if process.returncode == 0:
-            return {'success': True}
+            if 'error' in line.lower() or 'failed' in line.lower():
+                config.logger.error(f"FFmpeg error: {line}")
+
+        result = run_process(command, on_stdout=on_stdout, on_stderr=on_stderr, stdin=stdin)
+        if asin and group is None:
+            event_bus.publish_progress(asin, {'asin': asin, 'kind': 'convert', 'step': step, 'done': True, 'success': result.success}, final=True)
+
+        stats = dict(result.stats(), step=step, media_seconds=round(progress.media_seconds, 1),
+                     speed=progress.speed, samples=list(progress.samples))
+        config.logger.info(f"Conversion completed in {result.wall_time:.1f} seconds with status: {result.returncode}")
+
+        if result.success:
+            return {'success': True, 'stats': stats}
         else:
-            stderr = process.stderr.read()
-            config.logger.error(f"FFmpeg failed with error: {stderr_output}")
-            return {'success': False, 'error': stderr}
-            
+            config.logger.error(f"FFmpeg failed with error: {result.stderr}")
+            return {'success': False, 'error': result.killed or result.stderr, 'stats': stats}
+
     except Exception as e:
         config.logger.error(f"Conversion process error: {e}")
         return {'success': False, 'error': str(e)}
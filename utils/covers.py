@@ -0,0 +1,185 @@
+import os
+import time
+import http.client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urljoin
+import config
+from utils.library import library_snapshot, library_transaction
+from utils.files import download_content, download_many, DownloadType
+from utils.thumbnails import generate_thumbnails
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class ConnectionPool:
+    """Idle keep-alive HTTP(S) connections, reused per (scheme, host, port)"""
+
+    def __init__(self, max_idle_per_host=None, timeout=30):
+        self.max_idle_per_host = max_idle_per_host or config.COVER_FETCH_CONCURRENCY
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        return parts.scheme, parts.hostname, port
+
+    def get(self, url):
+        key = self._key(url)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return key, idle.pop()
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return key, connection_class(host, port, timeout=self.timeout)
+
+    def put(self, key, conn):
+        """Return a connection whose response has been fully read"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+def _request(pool, url, headers, redirects=3):
+    """GET url, following redirects; returns (status, headers, body)"""
+    for _ in range(redirects + 1):
+        key, conn = pool.get(url)
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += f"?{parts.query}"
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            pool.put(key, conn)
+
+        if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+            url = urljoin(url, response.getheader('Location'))
+            continue
+        return response.status, response, body
+    raise http.client.HTTPException(f"Too many redirects for {url}")
+
+def _retry_delay(attempt, response=None):
+    """Exponential backoff, or the server's Retry-After when it sends a short one"""
+    delay = config.COVER_FETCH_BACKOFF * (2 ** attempt)
+    retry_after = response.getheader('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay, 0), 30)
+
+def _cover_file(asin):
+    return os.path.join(config.IMAGES_DIR, f"{asin}.jpg")
+
+def fetch_cover(asin, book, pool):
+    """Fetch one book's cover_url into IMAGES_DIR and record it; returns a result dict"""
+    url = book.get('cover_url')
+    if not url:
+        return {'success': False, 'error': 'No cover URL'}
+
+    # Revalidate instead of refetching when we already hold this cover
+    headers = {'User-Agent': 'audible-cli-web', 'Accept': 'image/*'}
+    existing = book.get('cover_path')
+    if existing and os.path.exists(existing) and book.get('cover_source_url') == url:
+        if book.get('cover_etag'):
+            headers['If-None-Match'] = book['cover_etag']
+        if book.get('cover_last_modified'):
+            headers['If-Modified-Since'] = book['cover_last_modified']
+
+    last_error = None
+    for attempt in range(config.COVER_FETCH_RETRIES + 1):
+        response = None
+        try:
+            status, response, body = _request(pool, url, headers)
+            if status == 304:
+                return {'success': True, 'file': existing, 'not_modified': True}
+            if status == 200 and body:
+                break
+            last_error = f"HTTP {status}"
+            if status not in RETRY_STATUSES:
+                return {'success': False, 'error': f"Cover download failed: {last_error}"}
+        except (OSError, http.client.HTTPException) as e:
+            last_error = str(e)
+        if attempt < config.COVER_FETCH_RETRIES:
+            time.sleep(_retry_delay(attempt, response))
+    else:
+        return {'success': False, 'error': f"Cover download failed: {last_error}"}
+
+    path = _cover_file(asin)
+    os.makedirs(config.IMAGES_DIR, exist_ok=True)
+    temp_path = f"{path}.part"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(body)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    with library_transaction(asin) as entry:
+        if entry is not None:
+            entry['cover_path'] = path
+            entry['cover_source_url'] = url
+            entry['cover_etag'] = response.getheader('ETag')
+            entry['cover_last_modified'] = response.getheader('Last-Modified')
+    generate_thumbnails(asin, path)
+    return {'success': True, 'file': path}
+
+def fetch_covers(asins):
+    """Fetch many covers concurrently over pooled keep-alive connections; returns {asin: result}"""
+    library = library_snapshot()
+    pool = ConnectionPool()
+
+    def fetch(asin):
+        try:
+            return asin, fetch_cover(asin, library.get(asin, {}), pool)
+        except Exception as e:
+            config.logger.error(f"Cover fetch failed for {asin}: {e}", exc_info=True)
+            return asin, {'success': False, 'error': str(e)}
+
+    try:
+        with ThreadPoolExecutor(max_workers=config.COVER_FETCH_CONCURRENCY) as executor:
+            results = dict(executor.map(fetch, asins))
+    finally:
+        pool.close()
+    fetched = sum(1 for result in results.values() if result['success'])
+    config.logger.info(f"Fetched {fetched}/{len(asins)} covers over HTTP")
+    return results
+
+def download_covers(profile, asins):
+    """Download covers directly from cover_url where known, via audible-cli otherwise"""
+    library = library_snapshot()
+    direct = [asin for asin in asins if library.get(asin, {}).get('cover_url')]
+    results = fetch_covers(direct) if direct else {}
+    rest = [asin for asin in asins if asin not in results]
+    if len(rest) == 1:
+        results[rest[0]] = download_content(profile, rest[0], DownloadType.COVER)
+    elif rest:
+        results.update(download_many(profile, rest, DownloadType.COVER))
+    return results
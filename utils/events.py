@@ -0,0 +1,111 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+import config
+
+class Subscription:
+    """One connected client's undelivered events, coalesced by key
+
+    A newer event with the same key replaces the pending one in place, so
+    a slow client holds at most one event per job or book and per-event
+    work stays constant however many of either are being tracked.
+    """
+
+    def __init__(self, bus):
+        self._bus = bus
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._overflowed = False
+
+    def _push(self, key, event):
+        with self._cond:
+            if key in self._pending:
+                self._pending[key] = event
+            elif len(self._pending) >= config.EVENTS_QUEUE_MAX:
+                # Too far behind to catch up event by event: make the client resync instead
+                self._pending.clear()
+                self._overflowed = True
+            else:
+                self._pending[key] = event
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Wait up to timeout seconds and return the pending events, oldest first"""
+        with self._cond:
+            if not self._pending and not self._overflowed:
+                self._cond.wait(timeout)
+            events = list(self._pending.values())
+            self._pending.clear()
+            if self._overflowed:
+                self._overflowed = False
+                events = [('resync', {})]
+            return events
+
+    def close(self):
+        self._bus._unsubscribe(self)
+
+class EventBus:
+    """Fans events out to connected Server-Sent Events clients"""
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._last_progress = {}
+
+    def subscribe(self):
+        """Register a client; None if EVENTS_MAX_CLIENTS are already connected"""
+        with self._lock:
+            if len(self._subscribers) >= config.EVENTS_MAX_CLIENTS:
+                return None
+            subscription = Subscription(self)
+            self._subscribers.append(subscription)
+            return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event_type, data, key=None):
+        """Send an event to every client; events sharing (type, key) coalesce"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        key = (event_type, key)
+        for subscription in subscribers:
+            subscription._push(key, (event_type, data))
+
+    def publish_progress(self, key, data, final=False):
+        """Progress events, rate-limited per key to one every EVENTS_PROGRESS_INTERVAL"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._subscribers:
+                return
+            last = self._last_progress.get(key)
+            if not final and last is not None and now - last < config.EVENTS_PROGRESS_INTERVAL:
+                return
+            if final:
+                self._last_progress.pop(key, None)
+            else:
+                self._last_progress[key] = now
+        self.publish('progress', data, key)
+
+def format_event(event_type, data):
+    """Encode one event in text/event-stream framing"""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+# Process-wide bus; publishers import it, /events subscribes to it
+event_bus = EventBus()
+
+def transfer_progress(transferred, total, rate):
+    """Percent, bytes/sec and seconds remaining for a transfer, as sent in progress events"""
+    progress = {'bytes': int(transferred), 'total': int(total) if total else None, 'rate': None, 'eta': None}
+    if total:
+        progress['percent'] = round(min(transferred / total, 1.0) * 100, 1)
+    if rate:
+        progress['rate'] = round(rate)
+        if total:
+            progress['eta'] = round(max(total - transferred, 0) / rate)
+    return progress
@@ -1,6 +1,5 @@
 import os
 import time
-import subprocess
 import re
 from enum import Enum
 from dataclasses import dataclass
@@ -8,8 +7,12 @@ from pathlib import Path
 from typing import Optional, Dict, Any
 import json
 import config
-from utils.library import load_library, save_library, verify_files
-from utils.common import run_command
+from utils.library import library_snapshot, library_transaction, remove_book
+from utils.process import run_process
+from utils.thumbnails import generate_thumbnails
+from utils.concurrency import download_controller, TransferRate, parse_progress_amounts, THROTTLE_PATTERN
+from utils.events import event_bus, transfer_progress
+from utils.converter import conversion_progress
 
 # Types and Configuration
 class DownloadType(Enum):
@@ -27,9 +30,11 @@ class DownloadConfig:
     timeout: Optional[str] = None
     extra_fields: Optional[Dict[str, str]] = None
 
+# A started download with no output at all for this long is abandoned
+DOWNLOAD_IDLE_TIMEOUT = 3600
+
 # Shared state for UI status updates
 download_status = {}
-conversion_status = {}
 
 def get_download_config(download_type: DownloadType) -> DownloadConfig:
     """Get configuration for different download types"""
@@ -64,14 +69,174 @@ def get_download_config(download_type: DownloadType) -> DownloadConfig:
     }
     return configs[download_type]
 
+def record_downloaded_file(asin, path):
+    """Record a file audible-cli reported for an ASIN in the library; None if unrecognised"""
+    if not path.exists():
+        return None
+    if path.suffix == '.aaxc':
+        size = path.stat().st_size
+        # Check if the corresponding voucher file exists
+        voucher_path = path.with_suffix('.voucher')
+        with library_transaction(asin) as book:
+            if book is not None:
+                # This is the AAXC audio file
+                book['audible_file'] = str(path)
+                book['audible_size'] = size
+                book['audible_format'] = 'aaxc'
+
+                if voucher_path.exists():
+                    book['voucher_file'] = str(voucher_path)
+                    config.logger.info(f"Auto-linked voucher file: {voucher_path}")
+        return {'success': True, 'file': str(path)}
+    elif path.suffix == '.voucher':
+        # Check if the corresponding AAXC file exists
+        aaxc_path = path.with_suffix('.aaxc')
+        with library_transaction(asin) as book:
+            if book is not None:
+                # This is a voucher file
+                book['voucher_file'] = str(path)
+                config.logger.info(f"Recorded voucher file: {path}")
+
+                if aaxc_path.exists():
+                    book['audible_file'] = str(aaxc_path)
+                    book['audible_size'] = aaxc_path.stat().st_size
+                    book['audible_format'] = 'aaxc'
+                    config.logger.info(f"Auto-linked AAXC file: {aaxc_path}")
+        return {'success': True, 'file': str(path)}
+    elif path.suffix == '.aax':
+        with library_transaction(asin) as book:
+            if book is not None:
+                book['audible_file'] = str(path)
+                book['audible_size'] = path.stat().st_size
+                book['audible_format'] = 'aax'
+        return {'success': True, 'file': str(path)}
+    elif path.suffix == '.pdf':
+        with library_transaction(asin) as book:
+            if book is not None:
+                book['pdf_file'] = str(path)
+                book['pdf_size'] = path.stat().st_size
+                book['pdf_available'] = True
+        return {'success': True, 'file': str(path)}
+    elif path.suffix == '.jpg':
+        with library_transaction(asin) as book:
+            if book is not None:
+                book['cover_path'] = str(path)
+        generate_thumbnails(asin, str(path))
+        return {'success': True, 'file': str(path)}
+    return None
+
 def download_content(profile: str, asin: str, download_type: DownloadType, options: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Download one item and feed the outcome to the adaptive concurrency controller"""
+    transfer = {'rate': TransferRate(), 'throttled': False, 'stalled': False}
+    result = _download_content(profile, asin, download_type, options, transfer)
+    event_bus.publish_progress(asin, {
+        'asin': asin, 'kind': download_type.value, 'done': True, 'success': bool(result.get('success'))
+    }, final=True)
+
+    if transfer['throttled']:
+        download_controller.record_backoff(f"throttled while downloading {asin}")
+    elif 'timeout' in result.get('error', '').lower():
+        download_controller.record_backoff(f"timeout downloading {asin}")
+    elif result.get('success') and not transfer['stalled']:
+        download_controller.record_success(transfer['rate'].rate)
+    return result
+
+def download_many(profile, asins, download_type):
+    """Download covers or PDFs for many ASINs in a single audible-cli process
+
+    Files are named with their ASIN as prefix (--filename-mode asin_ascii)
+    so every reported file can be attributed back to its book. Returns
+    {asin: result} with results shaped like download_content's.
+    """
+    download_cfg = get_download_config(download_type)
+    cmd = ['audible', '-P', profile] + download_cfg.cli_args + [
+        '--filename-mode', 'asin_ascii', '--output-dir', str(download_cfg.output_dir)
+    ]
+    for asin in asins:
+        cmd += ['--asin', asin]
+    config.logger.info(f"Starting {download_type.value} download for {len(asins)} books in one audible-cli run")
+
+    results = {}
+    not_found = []
+    throttled = False
+
+    def on_line(line):
+        nonlocal throttled
+        match = re.search(r'File (.*?) (?:downloaded in|already exists)', line)
+        if match:
+            path = Path(match.group(1).strip())
+            asin = path.name.split('_', 1)[0]
+            if asin in asins and asin not in results:
+                result = record_downloaded_file(asin, path)
+                if result:
+                    results[asin] = result
+        elif "No PDF found for" in line:
+            not_found.append(line)
+        elif THROTTLE_PATTERN.search(line):
+            throttled = True
+            config.logger.warning(f"Throttled during grouped download: {line}")
+
+    output_dir = Path(download_cfg.output_dir)
+    before = set(os.listdir(output_dir)) if output_dir.is_dir() else set()
+    process = run_process(cmd, on_stdout=on_line, on_stderr=on_line, timeout=60 + 10 * len(asins))
+    if process.killed:
+        config.logger.error(f"{process.killed} in grouped {download_type.value} download")
+
+    library = library_snapshot()
+    for asin in asins:
+        if asin in results:
+            continue
+        title = library.get(asin, {}).get('amazon_title')
+        if download_type == DownloadType.PDF and any(asin in line or (title and title in line) for line in not_found):
+            with library_transaction(asin) as book:
+                if book is not None:
+                    book['pdf_available'] = False
+            results[asin] = {'success': False, 'error': 'No PDF available for this book', 'pdf_available': False}
+        elif process.killed:
+            if output_dir.is_dir():
+                _remove_partial_downloads(output_dir, before, asin, title or asin)
+            results[asin] = {'success': False, 'error': process.killed, 'cancelled': process.cancelled}
+        else:
+            results[asin] = {'success': False, 'error': 'No file downloaded'}
+
+    if process.cancelled:
+        # Cancelled or preempted on purpose; says nothing about the server
+        pass
+    elif throttled:
+        download_controller.record_backoff(f"throttled during grouped {download_type.value} download")
+    elif process.killed:
+        download_controller.record_backoff(f"timeout in grouped {download_type.value} download")
+    elif any(result['success'] for result in results.values()):
+        download_controller.record_success()
+
+    config.logger.info(f"Grouped {download_type.value} download: "
+                       f"{sum(1 for r in results.values() if r['success'])}/{len(asins)} succeeded")
+    return results
+
+def _remove_partial_downloads(output_dir, before, asin, book_title):
+    """Delete files for this book that appeared during an interrupted download"""
+    for path in Path(output_dir).iterdir():
+        if path.name in before or not path.is_file():
+            continue
+        # Be strict here: other downloads may be writing to the same directory
+        stem = re.sub(r'_Part_\d+.*$', '', path.name.split('-', 1)[0]).lower()
+        title = re.sub(r'[^\w]', '', book_title.lower().replace(' ', '_'))
+        stem = re.sub(r'[^\w]', '', stem)
+        if asin in path.name or stem == title or stem.endswith(f"_{title}"):
+            try:
+                path.unlink()
+                config.logger.info(f"Removed partial download {path}")
+            except OSError as e:
+                config.logger.warning(f"Could not remove partial download {path}: {e}")
+
+def _download_content(profile, asin, download_type, options, transfer):
     try:
-        library = load_library()
-        if asin not in library:
+        book = library_snapshot().get(asin)
+        if book is None:
             config.logger.error(f"ASIN '{asin}' not found in library.")
             return {'success': False, 'error': 'Book not found'}
 
-        book_title = library[asin].get('amazon_title', 'Unknown')
+        book_title = book.get('amazon_title', 'Unknown')
         config.logger.info(f"Starting {download_type.value} download for '{book_title}' (ASIN: {asin})")
         download_cfg = get_download_config(download_type)
 
@@ -80,24 +245,11 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
             cmd_base.extend(['-v', 'DEBUG'])
         cmd = cmd_base + ['-P', profile] + download_cfg.cli_args + ['--asin', asin, '--output-dir', str(download_cfg.output_dir)]
 
-        # Stream the output for real-time progress
-        import subprocess
-        
-        # Use PIPE for stdout and stderr to capture output
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        output_lines = []
-        error_lines = []
         downloaded_file = None
         is_locked = False
         last_progress_log = 0
+        last_progress_time = time.monotonic()
+        last_activity = time.monotonic()
         
         # Flag to indicate if download has started
         download_started = False
@@ -105,120 +257,96 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
         # Flag to indicate a multi-part book
         multi_part_download = False
         
-        # Function to process a line of output
-        def process_line(line, is_stderr=False):
-            nonlocal downloaded_file, is_locked, last_progress_log, download_started, multi_part_download
-            
-            line = line.strip()
-            if is_stderr:
-                error_lines.append(line)
-                
-                # Log progress updates at a reasonable rate
-                if '%' in line and '|' in line:
-                    # Extract progress percentage
-                    progress_match = re.search(r'(\d+)%', line)
-                    if progress_match:
-                        progress = int(progress_match.group(1))
-                        download_status[asin] = {'progress': progress}
-                
-                    current_time = time.time()
-                    if (current_time - last_progress_log > 1.0 and  # Log at most once per second
-                        len(line.strip()) > 10):                    # Ensure it's not an empty line
-                        config.logger.info(f"Progress: {line}")
-                        last_progress_log = current_time
-                        download_started = True
-                elif "is not downloadable" in line:
-                    is_locked = True
-                    config.logger.warning(f"Book '{book_title}' is locked or not downloadable")
-                elif len(line.strip()) > 0:  # Only log non-empty error lines
-                    # Skip logging empty error lines
-                    config.logger.info(f"Error: {line}")
-            else:
-                output_lines.append(line)
-                config.logger.info(f"Output: {line}")
-                
-                # Check for download completion or existing file
-                if "downloaded in" in line:
-                    match = re.search(r'File (.*?) downloaded in', line)
-                    if match:
-                        downloaded_file = match.group(1).strip()
-                elif "already exists" in line:
-                    match = re.search(r'File (.*?) already exists', line)
-                    if match:
-                        downloaded_file = match.group(1).strip()
-                elif "No PDF found for" in line and download_type == DownloadType.PDF:
-                    # Mark PDF as not available
-                    library[asin]['pdf_available'] = False
-                    save_library(library)
-                elif "be downloaded in parts" in line:
-                    # This indicates a larger download that will be processed in chunks
+        # Per-line handlers for the two output streams
+        def on_stderr(line):
+            nonlocal is_locked, last_progress_log, download_started, last_progress_time, last_activity
+            last_activity = time.monotonic()
+
+            # Log progress updates at a reasonable rate
+            if '%' in line and '|' in line:
+                # Extract progress percentage
+                progress_match = re.search(r'(\d+)%', line)
+                if progress_match:
+                    progress = int(progress_match.group(1))
+                    amounts = parse_progress_amounts(line)
+                    event = {}
+                    if amounts is not None:
+                        transfer['rate'].update(amounts[0])
+                        last_progress_time = time.monotonic()
+                        event = transfer_progress(amounts[0], amounts[1], transfer['rate'].rate)
+                    event.update(asin=asin, kind=download_type.value, percent=progress)
+                    download_status[asin] = dict(event, progress=progress)
+                    event_bus.publish_progress(asin, event)
+
+                current_time = time.time()
+                if (current_time - last_progress_log > 1.0 and  # Log at most once per second
+                    len(line.strip()) > 10):                    # Ensure it's not an empty line
+                    config.logger.info(f"Progress: {line}")
+                    last_progress_log = current_time
                     download_started = True
-                    multi_part_download = True
-                    config.logger.info(f"Large file detected, will be downloaded in parts: {asin}")
-        
-        # Read from stdout and stderr simultaneously using threads and queues
-        import threading
-        import queue
-        
-        stdout_queue = queue.Queue()
-        stderr_queue = queue.Queue()
-        
-        def enqueue_output(out, queue):
-            for line in iter(out.readline, ''):
-                queue.put(line)
-            out.close()
-        
-        # Start threads to read stdout and stderr
-        stdout_thread = threading.Thread(target=enqueue_output, args=(process.stdout, stdout_queue))
-        stderr_thread = threading.Thread(target=enqueue_output, args=(process.stderr, stderr_queue))
-        stdout_thread.daemon = True
-        stderr_thread.daemon = True
-        stdout_thread.start()
-        stderr_thread.start()
-        
-        # Process output from both streams while checking if process is still running
-        timeout_counter = 0
-        max_timeout = 3600  # Maximum wait time in seconds (1 hour)
-        
-        while process.poll() is None or not stdout_queue.empty() or not stderr_queue.empty():
-            # Check if we've been waiting too long with no progress
-            if download_started and timeout_counter > max_timeout:
-                config.logger.error(f"Download timeout exceeded for {asin}")
-                process.terminate()
-                return {'success': False, 'error': 'Download timeout exceeded'}
-            
-            # Process available stdout
-            try:
-                while True:
-                    line = stdout_queue.get_nowait()
-                    process_line(line, is_stderr=False)
-                    timeout_counter = 0  # Reset timeout counter on activity
-            except queue.Empty:
-                pass
-            
-            # Process available stderr
-            try:
-                while True:
-                    line = stderr_queue.get_nowait()
-                    process_line(line, is_stderr=True)
-                    timeout_counter = 0  # Reset timeout counter on activity
-            except queue.Empty:
-                pass
-            
-            # Wait a little before checking again
-            time.sleep(0.1)
-            
-            # Increment timeout counter if download has started
-            if download_started:
-                timeout_counter += 0.1
-        
-        # Process any remaining output after process completion
-        returncode = process.poll()
-        
+            elif "is not downloadable" in line:
+                is_locked = True
+                config.logger.warning(f"Book '{book_title}' is locked or not downloadable")
+            elif THROTTLE_PATTERN.search(line):
+                transfer['throttled'] = True
+                config.logger.warning(f"Throttled while downloading {asin}: {line}")
+            elif len(line.strip()) > 0:  # Only log non-empty error lines
+                # Skip logging empty error lines
+                config.logger.info(f"Error: {line}")
+
+        def on_stdout(line):
+            nonlocal downloaded_file, download_started, multi_part_download, last_activity
+            last_activity = time.monotonic()
+            config.logger.info(f"Output: {line}")
+
+            # Check for download completion or existing file
+            if "downloaded in" in line:
+                match = re.search(r'File (.*?) downloaded in', line)
+                if match:
+                    downloaded_file = match.group(1).strip()
+            elif "already exists" in line:
+                match = re.search(r'File (.*?) already exists', line)
+                if match:
+                    downloaded_file = match.group(1).strip()
+            elif "No PDF found for" in line and download_type == DownloadType.PDF:
+                # Mark PDF as not available
+                with library_transaction(asin) as book:
+                    if book is not None:
+                        book['pdf_available'] = False
+            elif "be downloaded in parts" in line:
+                # This indicates a larger download that will be processed in chunks
+                download_started = True
+                multi_part_download = True
+                config.logger.info(f"Large file detected, will be downloaded in parts: {asin}")
+
+        def watchdog():
+            if not download_started:
+                return None
+            now = time.monotonic()
+            # Bytes stopped moving: count it against the concurrency window once
+            if not transfer['stalled'] and now - last_progress_time > config.DOWNLOAD_STALL_SECONDS:
+                transfer['stalled'] = True
+                config.logger.warning(f"Download of {asin} stalled")
+                download_controller.record_backoff(f"download of {asin} stalled")
+            # Give up after a long stretch with no output at all
+            if now - last_activity > DOWNLOAD_IDLE_TIMEOUT:
+                return 'Download timeout exceeded'
+            return None
+
+        output_dir = Path(download_cfg.output_dir)
+        before = set(os.listdir(output_dir)) if output_dir.is_dir() else set()
+        process = run_process(cmd, on_stdout=on_stdout, on_stderr=on_stderr, watchdog=watchdog)
+        if process.killed:
+            config.logger.error(f"{process.killed} for {asin}")
+            if output_dir.is_dir():
+                _remove_partial_downloads(output_dir, before, asin, book_title)
+            return {'success': False, 'error': process.killed, 'cancelled': process.cancelled}
+
         # Handle locked books
         if is_locked:
-            library[asin]['locked'] = True
-            save_library(library)
+            with library_transaction(asin) as book:
+                if book is not None:
+                    book['locked'] = True
             return {
                 'success': False, 
                 'error': 'Book is locked or not available for download',
@@ -268,7 +396,7 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
                 config.logger.info(f"Found {len(part_files)} parts for book '{book_title}'")
                 
                 # Initialize parts array
-                library[asin]['parts'] = []
+                parts = []
                 total_size = 0
                 
                 # Process each part file
@@ -282,20 +410,21 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
                         'format': part_file.suffix[1:]  # Remove the leading dot
                     }
                     
-                    library[asin]['parts'].append(part_info)
+                    parts.append(part_info)
                 
-                # Mark as multi-part in the library
-                library[asin]['is_multi_part'] = True
-                library[asin]['parts_count'] = len(part_files)
-                
-                # Set the first part as the main file for backward compatibility
-                # but use the total size of all parts
-                library[asin]['audible_file'] = str(part_files[0])
-                library[asin]['audible_size'] = total_size
-                library[asin]['audible_format'] = part_files[0].suffix[1:]
-                
-                # Save the updated library
-                save_library(library)
+                with library_transaction(asin) as book:
+                    if book is not None:
+                        book['parts'] = parts
+
+                        # Mark as multi-part in the library
+                        book['is_multi_part'] = True
+                        book['parts_count'] = len(part_files)
+
+                        # Set the first part as the main file for backward compatibility
+                        # but use the total size of all parts
+                        book['audible_file'] = str(part_files[0])
+                        book['audible_size'] = total_size
+                        book['audible_format'] = part_files[0].suffix[1:]
                 
                 return {
                     'success': True,
@@ -307,52 +436,9 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
         
         # Process the file if we found one
         if downloaded_file:
-            path = Path(downloaded_file)
-            if path.exists():
-                if path.suffix == '.aaxc':
-                    size = path.stat().st_size
-                    # This is the AAXC audio file
-                    library[asin]['audible_file'] = str(path)
-                    library[asin]['audible_size'] = size
-                    library[asin]['audible_format'] = 'aaxc'
-
-                    # Check if the corresponding voucher file exists
-                    voucher_path = path.with_suffix('.voucher')
-                    if voucher_path.exists():
-                        library[asin]['voucher_file'] = str(voucher_path)
-                        config.logger.info(f"Auto-linked voucher file: {voucher_path}")
-                    save_library(library)
-                    return {'success': True, 'file': str(path)}
-                elif path.suffix == '.voucher':
-                    # This is a voucher file
-                    library[asin]['voucher_file'] = str(path)
-                    config.logger.info(f"Recorded voucher file: {path}")
-            
-                    # Check if the corresponding AAXC file exists
-                    aaxc_path = path.with_suffix('.aaxc')
-                    if aaxc_path.exists():
-                        library[asin]['audible_file'] = str(aaxc_path)
-                        library[asin]['audible_size'] = aaxc_path.stat().st_size
-                        library[asin]['audible_format'] = 'aaxc'
-                        config.logger.info(f"Auto-linked AAXC file: {aaxc_path}")
-                    save_library(library)
-                    return {'success': True, 'file': str(path)}
-                elif path.suffix == '.aax':
-                    library[asin]['audible_file'] = str(path)
-                    library[asin]['audible_size'] = path.stat().st_size
-                    library[asin]['audible_format'] = 'aax'
-                    save_library(library)
-                    return {'success': True, 'file': str(path)}
-                elif path.suffix == '.pdf':
-                    library[asin]['pdf_file'] = str(path)
-                    library[asin]['pdf_size'] = path.stat().st_size
-                    library[asin]['pdf_available'] = True
-                    save_library(library)
-                    return {'success': True, 'file': str(path)}
-                elif path.suffix == '.jpg':
-                    library[asin]['cover_path'] = str(path)
-                    save_library(library)
-                    return {'success': True, 'file': str(path)}
+            result = record_downloaded_file(asin, Path(downloaded_file))
+            if result:
+                return result
 
         # Check for large files downloaded in parts
         # AAX files downloaded in parts might be named differently
@@ -366,17 +452,19 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
                 largest_file = max(possible_files, key=lambda p: p.stat().st_size)
                 # Check if file size is reasonable (not just a stub)
                 if largest_file.stat().st_size > 1024 * 1024:  # Larger than 1MB
-                    library[asin]['audible_file'] = str(largest_file)
-                    library[asin]['audible_size'] = largest_file.stat().st_size
-                    library[asin]['audible_format'] = 'aax'
-                    save_library(library)
+                    with library_transaction(asin) as book:
+                        if book is not None:
+                            book['audible_file'] = str(largest_file)
+                            book['audible_size'] = largest_file.stat().st_size
+                            book['audible_format'] = 'aax'
                     return {'success': True, 'file': str(largest_file)}
 
         # Check specifically for PDF not available
-        if download_type == DownloadType.PDF and any("No PDF found for" in line for line in output_lines):
+        if download_type == DownloadType.PDF and any("No PDF found for" in line for line in process.stdout_tail):
             config.logger.info(f"No PDF available for book: {book_title}")
-            library[asin]['pdf_available'] = False
-            save_library(library)
+            with library_transaction(asin) as book:
+                if book is not None:
+                    book['pdf_available'] = False
             return {
                 'success': False,
                 'message': 'No PDF available for this book',
@@ -384,16 +472,18 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
             }
 
         # If we reach here with no file and no lock, check if "No new files downloaded" was in output
-        if any("No new files downloaded" in line for line in output_lines):
+        if any("No new files downloaded" in line for line in process.stdout_tail):
             # This might happen if we tried to download a book that's not available
             # Mark it as locked since we couldn't download it
-            library[asin]['locked'] = True
-            save_library(library)
+            with library_transaction(asin) as book:
+                if book is not None:
+                    book['locked'] = True
             return {'success': False, 'error': 'No downloadable file found - book may be locked'}
 
         # If no other condition was met, mark as locked by default for failed downloads
-        library[asin]['locked'] = True
-        save_library(library)
+        with library_transaction(asin) as book:
+            if book is not None:
+                book['locked'] = True
         return {'success': False, 'error': 'No downloadable file found - book may not be in your library'}
 
     except Exception as e:
@@ -402,7 +492,7 @@ def download_content(profile: str, asin: str, download_type: DownloadType, optio
 
 def get_file_status(asin):
     """Get status of a book's download and conversion"""
-    library = load_library()
+    library = library_snapshot()
     status = {
         'download': 'not_started',
         'conversion': 'not_started',
@@ -426,8 +516,11 @@ def get_file_status(asin):
         if book.get('m4b_file'):
             status['conversion'] = 'completed'
             status['files']['m4b'] = book['m4b_file']
-        elif asin in conversion_status:
-            status['conversion'] = conversion_status[asin]
+        else:
+            progress = conversion_progress(asin)
+            if progress:
+                status['conversion'] = progress['state']
+                status['conversion_progress'] = progress
 
         # Add cover info if available
         if book.get('cover_path'):
@@ -437,11 +530,10 @@ def get_file_status(asin):
 
 def delete_book(asin):
     try:
-        library = load_library()
-        if asin not in library:
+        book = library_snapshot().get(asin)
+        if book is None:
             return {'success': False, 'error': 'Book not found'}
 
-        book = library[asin]
         book_title = book.get('amazon_title', 'Unknown Title')
 
         # Delete Audible file
@@ -463,8 +555,7 @@ def delete_book(asin):
                 config.logger.error(f"Error deleting M4B file: {e}")
 
         # Remove book entry from library
-        del library[asin]
-        save_library(library)
+        remove_book(asin)
 
         return {'success': True, 'message': f"Deleted '{book_title}'"}
     except Exception as e:
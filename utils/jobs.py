@@ -0,0 +1,643 @@
+import os
+import json
+import time
+import uuid
+import inspect
+import sqlite3
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any
+import config
+from utils.files import download_content, download_many, DownloadType
+from utils.converter import convert_book
+from utils.covers import download_covers
+from utils.concurrency import download_controller
+from utils.process import CancelToken, cancel_scope
+from utils.events import event_bus
+
+def _download_pdf(profile, asin):
+    result = download_content(profile, asin, DownloadType.PDF)
+    # Report a missing PDF as an error so callers need only check one field
+    if not result['success'] and 'No PDF available' in result.get('message', ''):
+        return {'success': False, 'error': 'No PDF available for this book'}
+    return result
+
+# Job type -> function run by a worker; each returns a {'success': ...} result dict
+JOB_HANDLERS = {
+    'download_book': lambda profile, asin, options=None: download_content(profile, asin, DownloadType.BOOK, options),
+    'download_cover': lambda profile, asin: download_covers(profile, [asin])[asin],
+    'download_pdf': _download_pdf,
+    'convert': lambda asin: convert_book(asin),
+}
+
+DOWNLOAD_JOB_TYPES = {'download_book', 'download_cover', 'download_pdf'}
+
+# Priority lanes, highest first: single-item actions a user clicked, scheduled
+# sync work and bulk backfill batches. Interactive jobs may preempt the others.
+INTERACTIVE = 'interactive'
+SYNC = 'sync'
+BULK = 'bulk'
+JOB_PRIORITIES = (INTERACTIVE, SYNC, BULK)
+
+# Job types whose pending jobs for one profile are run together: (profile, asins) -> {asin: result}
+GROUPED_DOWNLOAD_TYPES = {
+    'download_cover': download_covers,
+    'download_pdf': lambda profile, asins: download_many(profile, asins, DownloadType.PDF),
+}
+
+def _run_group(jobs):
+    """Run same-type, same-profile download jobs together; returns {job id: result}"""
+    by_asin = {job.params['asin']: job for job in jobs}
+    results = GROUPED_DOWNLOAD_TYPES[jobs[0].type](jobs[0].params['profile'], list(by_asin))
+    return {job.id: results.get(asin) for asin, job in by_asin.items()}
+
+@dataclass
+class Job:
+    type: str
+    params: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    state: str = 'queued'  # queued -> running -> succeeded | failed | cancelled
+    priority: str = INTERACTIVE
+    attempts: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+    # Set while a cancel or preemption is in flight; preempted jobs go back in the queue
+    cancel_reason: Optional[str] = field(default=None, repr=False)
+    preempted: bool = field(default=False, repr=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'params': self.params,
+            'state': self.state,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+_COLUMNS = ['id', 'type', 'params', 'state', 'priority', 'attempts', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+
+class JobStore:
+    """Jobs persisted one row each in SQLite so they survive restarts"""
+
+    def __init__(self, path=None):
+        self.path = path or config.JOBS_DB
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, type TEXT NOT NULL, params TEXT NOT NULL, state TEXT NOT NULL, '
+                "priority TEXT NOT NULL DEFAULT 'interactive', "
+                'attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, '
+                'created_at REAL NOT NULL, started_at REAL, finished_at REAL)'
+            )
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            if 'priority' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT 'interactive'")
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)')
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row(job):
+        return (
+            job.id, job.type, json.dumps(job.params), job.state, job.priority, job.attempts,
+            json.dumps(job.result) if job.result is not None else None,
+            job.error, job.created_at, job.started_at, job.finished_at
+        )
+
+    @staticmethod
+    def _job(row):
+        values = dict(zip(_COLUMNS, row))
+        values['params'] = json.loads(values['params'])
+        values['result'] = json.loads(values['result']) if values['result'] else None
+        return Job(**values)
+
+    def save(self, job):
+        self.save_many([job])
+
+    def save_many(self, jobs):
+        """Write several jobs in a single transaction"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    [self._row(job) for job in jobs]
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._job(row) if row else None
+
+    def list(self, state=None, limit=200):
+        """Most recent jobs first"""
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        args = []
+        if state:
+            query += ' WHERE state = ?'
+            args.append(state)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        args.append(limit)
+        with self._lock:
+            rows = self._connect().execute(query, args).fetchall()
+        return [self._job(row) for row in rows]
+
+    def unfinished(self):
+        """Queued and interrupted (still 'running') jobs in submission order"""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE state IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def prune(self, before):
+        """Forget finished jobs older than the given timestamp"""
+        with self._lock:
+            self._connect().execute(
+                "DELETE FROM jobs WHERE state IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?", (before,)
+            )
+
+class JobScheduler:
+    """Hands queued jobs to workers, weighted fair across priority lanes and in
+    submission order within each, subject to concurrency caps
+
+    Lanes are served by stride scheduling: each start advances its lane's
+    pass by 1/weight (JOB_LANE_WEIGHTS) and the lane with the lowest pass
+    goes next, so with the default weights an interactive job is picked
+    ahead of up to eight bulk ones. A lane that was idle rejoins at the
+    current minimum pass instead of cashing in credit for the time it had
+    nothing queued.
+
+    A job keeps its place but is skipped while another job for the same ASIN
+    is running, while the global or its profile's download cap is full (for
+    downloads), or while the conversion cap is full (for conversions); the
+    next lane gets the slot instead.
+
+    Cover and PDF jobs are handed out in groups: the first eligible one plus
+    other pending jobs of the same type and profile, up to DOWNLOAD_GROUP_SIZE.
+    A group takes a single download slot.
+    """
+
+    def __init__(self, download_limit=None, profile_limit=None, convert_limit=None):
+        self._download_limit = download_limit
+        self.profile_limit = profile_limit or config.DOWNLOAD_PROFILE_CONCURRENCY
+        self.convert_limit = convert_limit or config.CONVERSION_CONCURRENCY
+        self._cond = threading.Condition()
+        self._pending = {lane: [] for lane in JOB_PRIORITIES}
+        self._pass = {lane: 0.0 for lane in JOB_PRIORITIES}
+        self._asins = set()
+        self._downloads = 0
+        self._conversions = 0
+        self._profiles = defaultdict(int)
+
+    @property
+    def download_limit(self):
+        """Fixed cap if one was given, otherwise the adaptive controller's window"""
+        return self._download_limit or download_controller.limit
+
+    @property
+    def running_downloads(self):
+        return self._downloads
+
+    def wake(self):
+        """Re-check pending jobs, e.g. after a limit changed"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def put(self, *jobs):
+        """Make jobs pending; several are added at once so a worker can group them"""
+        with self._cond:
+            for job in jobs:
+                lane = self._pending[job.priority]
+                if not lane:
+                    active = [self._pass[name] for name, pending in self._pending.items() if pending]
+                    if active:
+                        self._pass[job.priority] = max(self._pass[job.priority], min(active))
+                lane.append(job)
+            self._cond.notify(len(jobs))
+
+    def remove(self, job):
+        """Take a job out of the pending list; False if a worker already has it"""
+        with self._cond:
+            try:
+                self._pending[job.priority].remove(job)
+                return True
+            except ValueError:
+                return False
+
+    def _blocked_by(self, job):
+        """Which cap keeps job from starting: None, 'asin', 'download', 'profile' or 'convert'"""
+        if job.params.get('asin') in self._asins:
+            return 'asin'
+        if job.type in DOWNLOAD_JOB_TYPES:
+            if self._downloads >= self.download_limit:
+                return 'download'
+            if self._profiles[job.params.get('profile')] >= self.profile_limit:
+                return 'profile'
+        elif job.type == 'convert' and self._conversions >= self.convert_limit:
+            return 'convert'
+        return None
+
+    def blocked_by(self, job):
+        with self._cond:
+            return self._blocked_by(job)
+
+    def _acquire(self, jobs, sign):
+        for job in jobs:
+            asin = job.params.get('asin')
+            if asin is None:
+                continue
+            if sign > 0:
+                self._asins.add(asin)
+            else:
+                self._asins.discard(asin)
+        job = jobs[0]
+        if job.type in DOWNLOAD_JOB_TYPES:
+            self._downloads += sign
+            self._profiles[job.params.get('profile')] += sign
+        elif job.type == 'convert':
+            self._conversions += sign
+
+    def _group(self, first):
+        """Pull pending jobs of first's lane that can share its process out of the queue"""
+        group = [first]
+        if first.type not in GROUPED_DOWNLOAD_TYPES:
+            return group
+        asins = {first.params.get('asin')}
+        remaining = []
+        for job in self._pending[first.priority]:
+            if (len(group) < config.DOWNLOAD_GROUP_SIZE and job.type == first.type
+                    and job.params.get('profile') == first.params.get('profile')
+                    and job.params.get('asin') not in self._asins
+                    and job.params.get('asin') not in asins):
+                group.append(job)
+                asins.add(job.params.get('asin'))
+            else:
+                remaining.append(job)
+        self._pending[first.priority] = remaining
+        return group
+
+    def take(self):
+        """Block until some pending job may start, then claim slots and return its group"""
+        with self._cond:
+            while True:
+                lanes = sorted(
+                    (lane for lane, jobs in self._pending.items() if jobs),
+                    key=lambda lane: (self._pass[lane], JOB_PRIORITIES.index(lane))
+                )
+                for lane in lanes:
+                    for i, job in enumerate(self._pending[lane]):
+                        if self._blocked_by(job) is None:
+                            del self._pending[lane][i]
+                            jobs = self._group(job)
+                            self._acquire(jobs, 1)
+                            self._pass[lane] += 1 / max(config.JOB_LANE_WEIGHTS.get(lane, 1), 1)
+                            return jobs
+                self._cond.wait()
+
+    def release(self, jobs):
+        with self._cond:
+            self._acquire(jobs, -1)
+            self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            return {
+                'pending': sum(len(jobs) for jobs in self._pending.values()),
+                'lanes': {
+                    lane: {'pending': len(jobs), 'weight': config.JOB_LANE_WEIGHTS.get(lane, 1)}
+                    for lane, jobs in self._pending.items()
+                },
+                'downloads': {'running': self._downloads, 'limit': self.download_limit},
+                'conversions': {'running': self._conversions, 'limit': self.convert_limit},
+                'profiles': {
+                    profile: {'running': count, 'limit': self.profile_limit}
+                    for profile, count in self._profiles.items() if count
+                },
+                'asins': sorted(self._asins),
+            }
+
+class JobQueue:
+    """Persisted jobs drained by a fixed pool of worker threads via a JobScheduler
+
+    Live jobs are also kept in memory so waiters can block on them; the
+    store is the source of truth for everything else.
+    """
+
+    def __init__(self, workers=None, store=None):
+        self.workers = workers or config.JOB_WORKERS
+        self.store = store or JobStore()
+        self.scheduler = JobScheduler()
+        download_controller.add_listener(self.scheduler.wake)
+        download_controller.set_usage(lambda: self.scheduler.running_downloads)
+        self._jobs = {}
+        self._runs = {}  # CancelToken -> jobs a worker is running under it
+        self._lock = threading.Lock()
+        self._threads = []
+        self._resumed = False
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job_type, priority=INTERACTIVE, **params):
+        """Queue a job and return it immediately"""
+        job, = self.submit_many(job_type, [params], priority=priority)
+        config.logger.info(f"Queued {job_type} job {job.id} {params}")
+        return job
+
+    def submit_many(self, job_type, params_list, start=True, priority=INTERACTIVE):
+        """Persist one job per params dict together; start=False leaves them for start()"""
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job type: {job_type}")
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown job priority: {priority}")
+        # Reject bad parameters now rather than as a TypeError once a worker runs the job
+        signature = inspect.signature(JOB_HANDLERS[job_type])
+        for params in params_list:
+            try:
+                signature.bind(**params)
+            except TypeError as e:
+                raise ValueError(f"Invalid parameters for {job_type} job: {e}") from None
+        jobs = [Job(job_type, params, priority=priority) for params in params_list]
+        self.store.save_many(jobs)
+        if start:
+            self.start(jobs)
+        return jobs
+
+    def start(self, jobs):
+        """Hand already persisted jobs to the workers"""
+        self._enqueue(*jobs)
+        for job in jobs:
+            if job.priority == INTERACTIVE:
+                self._preempt_for(job)
+
+    def cancel(self, job_id, reason='Cancelled by user'):
+        """Cancel a queued or running job; returns it, or None if it isn't live
+
+        A running job's child process group is killed and its handler removes
+        partial output. A job sharing a grouped run is only stopped once every
+        job in the group has been cancelled.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done.is_set():
+                return None
+            job.cancel_reason = reason
+            job.preempted = False
+            queued = self.scheduler.remove(job)
+            if queued:
+                self._jobs.pop(job.id, None)
+            else:
+                for token, jobs in self._runs.items():
+                    if job in jobs and all(j.cancel_reason for j in jobs):
+                        token.cancel(reason)
+        config.logger.info(f"Cancelling {job.state} {job.type} job {job.id}")
+        if queued:
+            self._finish(job, {'success': False, 'error': reason})
+        return job
+
+    def _preempt_for(self, job):
+        """Stop a sync or bulk run when an interactive job would otherwise have to wait"""
+        with self._lock:
+            blocked = self.scheduler.blocked_by(job)
+            if blocked == 'asin' or (blocked is None and len(self._runs) < self.workers):
+                return
+            candidates = [
+                (token, jobs) for token, jobs in self._runs.items()
+                if not token.cancelled and all(j.priority != INTERACTIVE for j in jobs)
+            ]
+            if blocked in ('download', 'profile'):
+                candidates = [(token, jobs) for token, jobs in candidates if jobs[0].type in DOWNLOAD_JOB_TYPES]
+            if blocked == 'profile':
+                profile = job.params.get('profile')
+                candidates = [(token, jobs) for token, jobs in candidates if jobs[0].params.get('profile') == profile]
+            elif blocked == 'convert':
+                candidates = [(token, jobs) for token, jobs in candidates if jobs[0].type == 'convert']
+            if not candidates:
+                return
+            # Bulk work before scheduled sync, and the run with the least work to lose
+            token, jobs = max(candidates, key=lambda candidate: (
+                JOB_PRIORITIES.index(candidate[1][0].priority), candidate[1][0].started_at or 0
+            ))
+            for victim in jobs:
+                victim.cancel_reason = 'Preempted'
+                victim.preempted = True
+            token.cancel('Preempted')
+        config.logger.info(f"Preempting {jobs[0].priority} {jobs[0].type} job(s) {[j.id for j in jobs]} for {job.type} job {job.id}")
+
+    def _enqueue(self, *jobs):
+        with self._lock:
+            for job in jobs:
+                self._jobs[job.id] = job
+        self._start_workers()
+        # All at once: enqueued one by one, an idle worker would take the first job alone
+        self.scheduler.put(*jobs)
+        for job in jobs:
+            _publish(job)
+
+    def resume(self):
+        """Re-queue jobs left queued or running by a previous process"""
+        with self._lock:
+            if self._resumed:
+                return 0
+            self._resumed = True
+        before = time.time() - config.JOB_RETENTION_DAYS * 86400
+        self.store.prune(before)
+        for callback in _prune_listeners:
+            try:
+                callback(before)
+            except Exception as e:
+                config.logger.error(f"Prune listener failed: {e}", exc_info=True)
+        resumed = []
+        for job in self.store.unfinished():
+            with self._lock:
+                if job.id in self._jobs:
+                    continue
+            if job.state == 'running' and job.attempts >= config.JOB_MAX_ATTEMPTS:
+                job.state = 'failed'
+                job.error = f"Interrupted after {job.attempts} attempts"
+                job.result = {'success': False, 'error': job.error}
+                job.finished_at = time.time()
+                self.store.save(job)
+                config.logger.warning(f"Giving up on interrupted {job.type} job {job.id}")
+                _notify(job)
+                continue
+            job.state = 'queued'
+            self.store.save(job)
+            resumed.append(job)
+        if resumed:
+            self._enqueue(*resumed)
+            config.logger.info(f"Resumed {len(resumed)} unfinished jobs")
+        return len(resumed)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job or self.store.get(job_id)
+
+    def list(self, state=None):
+        return self.store.list(state)
+
+    def _work(self):
+        while True:
+            jobs = self.scheduler.take()
+            token = CancelToken()
+            with self._lock:
+                self._runs[token] = jobs
+            try:
+                self._run(jobs, token)
+            finally:
+                with self._lock:
+                    del self._runs[token]
+                    for job in jobs:
+                        # Preempted jobs are back in the queue and stay live
+                        if job.state != 'queued':
+                            self._jobs.pop(job.id, None)
+                self.scheduler.release(jobs)
+
+    def _run(self, jobs, token):
+        """Run one job, or a group of cover/PDF jobs sharing one audible-cli process"""
+        with self._lock:
+            # Jobs cancelled between being taken and getting here never start
+            live = [job for job in jobs if not job.cancel_reason]
+        now = time.time()
+        for job in live:
+            job.state = 'running'
+            job.started_at = now
+            job.attempts += 1
+        results = {}
+        if live:
+            self.store.save_many(live)
+            for job in live:
+                _publish(job)
+            try:
+                with cancel_scope(token):
+                    if len(live) == 1:
+                        results = {live[0].id: JOB_HANDLERS[live[0].type](**live[0].params)}
+                    else:
+                        results = _run_group(live)
+            except Exception as e:
+                config.logger.error(f"{live[0].type} job(s) {[job.id for job in live]} crashed: {e}", exc_info=True)
+                results = {job.id: {'success': False, 'error': str(e)} for job in live}
+        for job in jobs:
+            self._finish(job, results.get(job.id) or {'success': False, 'error': job.cancel_reason or 'No result'})
+
+    def _finish(self, job, result):
+        if job.cancel_reason and not result.get('success'):
+            if job.preempted:
+                self._requeue(job)
+                return
+            result = {'success': False, 'error': job.cancel_reason, 'cancelled': True}
+        job.result = result
+        if result.get('cancelled'):
+            job.state = 'cancelled'
+        else:
+            job.state = 'succeeded' if result.get('success') else 'failed'
+        job.error = None if job.state == 'succeeded' else result.get('error')
+        job.finished_at = time.time()
+        try:
+            self.store.save(job)
+        except Exception as e:
+            config.logger.error(f"Error saving job {job.id}: {e}")
+        config.logger.info(f"Job {job.id} ({job.type}) {job.state}")
+        _publish(job)
+        _notify(job)
+        job.done.set()
+
+    def _requeue(self, job):
+        """Put a preempted job back in the queue without counting the interrupted attempt"""
+        job.state = 'queued'
+        job.attempts = max(job.attempts - 1, 0)
+        job.started_at = None
+        job.cancel_reason = None
+        job.preempted = False
+        try:
+            self.store.save(job)
+        except Exception as e:
+            config.logger.error(f"Error saving job {job.id}: {e}")
+        config.logger.info(f"Requeued preempted {job.type} job {job.id}")
+        self.scheduler.put(job)
+        _publish(job)
+
+# Callbacks run on the worker thread with each job once it has finished
+_listeners = []
+
+def add_job_listener(callback):
+    _listeners.append(callback)
+
+# Callbacks run with the cutoff timestamp whenever old finished jobs are pruned
+_prune_listeners = []
+
+def add_prune_listener(callback):
+    _prune_listeners.append(callback)
+
+def _publish(job):
+    """Push a job's state to /events clients"""
+    event_bus.publish('job', job.to_dict(), job.id)
+
+def _notify(job):
+    for callback in _listeners:
+        try:
+            callback(job)
+        except Exception as e:
+            config.logger.error(f"Job listener failed for {job.id}: {e}", exc_info=True)
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return the process-wide job queue, creating it on first use"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+def resume_jobs():
+    return get_job_queue().resume()
+
+def submit_job(job_type, priority=INTERACTIVE, **params):
+    return get_job_queue().submit(job_type, priority, **params)
+
+def cancel_job(job_id):
+    return get_job_queue().cancel(job_id)
+
+def get_job(job_id):
+    return get_job_queue().get(job_id)
+
+def run_job(job_type, **params):
+    """Run a job on the worker pool and wait for its result"""
+    job = submit_job(job_type, **params)
+    job.done.wait()
+    return job.result
@@ -1,52 +1,522 @@
 import json
-import fcntl
-import tempfile
-import os
+import time
+import base64
+import atexit
+import bisect
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
 from pathlib import Path
-from collections import defaultdict
+from collections import deque
 import config
 from utils.common import run_command
+from utils.library_store import get_store, same_book, JsonLibraryStore
+from utils.library_index import LibraryIndex, LibraryStats, ALL_PROFILES
+from utils.events import event_bus
+
+# Process-wide cache of the parsed library, keyed on the store's change token
+_cache_lock = threading.RLock()
+_UNLOADED = object()
+_cache = {'key': _UNLOADED, 'snapshot': MappingProxyType({})}
+_store = None
+_index = LibraryIndex()
+_stats = LibraryStats()
+
+# Bumped on every change to the cached snapshot; the epoch keeps versions unique across restarts
+_version = {'epoch': format(int(time.time()), 'x'), 'counter': 0, 'reset_at': 0, 'evicted': 0}
+
+# Recent (counter, asin) pairs for delta sync; a full reload resets the log. 'evicted' is the
+# newest version any of whose entries have fallen off the end, so deltas from before it are incomplete
+_change_log = deque(maxlen=config.LIBRARY_CHANGE_LOG_SIZE)
+
+# ASIN -> cover image path, so serving covers never has to consult the store
+_cover_paths = {}
+
+def _set_snapshot(snapshot):
+    """Replace the cached snapshot wholesale and rebuild the indexes; caller holds _cache_lock"""
+    _cache['snapshot'] = snapshot
+    _index.rebuild(snapshot)
+    _cover_paths.clear()
+    _cover_paths.update((asin, book['cover_path']) for asin, book in snapshot.items() if book.get('cover_path'))
+    _stats.rebuild(snapshot)
+    _version['counter'] += 1
+    _version['reset_at'] = _version['counter']
+    _change_log.clear()
+    _publish_version()
+    return snapshot
+
+def _publish_version():
+    """Tell /events clients the library moved on; they fetch the delta themselves"""
+    event_bus.publish('library', {'version': f"{_version['epoch']}-{_version['counter']}"})
+
+class _SharedExclusiveLock:
+    """Many single-book transactions may run at once; whole-library ones run alone"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = None
+        self._depth = 0
+
+    @contextmanager
+    def shared(self):
+        me = threading.get_ident()
+        with self._cond:
+            # A thread inside an exclusive transaction may nest single-book ones
+            while self._exclusive not in (None, me):
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        me = threading.get_ident()
+        with self._cond:
+            while self._exclusive not in (None, me) or (self._exclusive is None and self._shared):
+                self._cond.wait()
+            self._exclusive = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._exclusive = None
+                self._cond.notify_all()
+
+_library_lock = _SharedExclusiveLock()
+_asin_locks = {}
+_asin_locks_guard = threading.Lock()
+
+def _asin_lock(asin):
+    with _asin_locks_guard:
+        return _asin_locks.setdefault(asin, threading.RLock())
+
+def get_library_store():
+    """Return the process-wide library store backend"""
+    global _store
+    with _cache_lock:
+        if _store is None:
+            _store = get_store()
+            config.logger.info(f"Using {_store.name} library store")
+        return _store
+
+def freeze(value):
+    """Recursively convert dicts and lists into read-only equivalents"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def thaw(value):
+    """Recursively convert a frozen snapshot back into mutable dicts and lists"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+def library_snapshot():
+    """Return a read-only snapshot of the library, reloading only when the store changes"""
+    with _cache_lock:
+        store = get_library_store()
+        try:
+            key = store.cache_key()
+        except Exception as e:
+            config.logger.error(f"Error checking library store: {e}")
+            return _cache['snapshot']
+
+        # Unflushed write-behind changes make the cached copy authoritative
+        if _pending['changes'] or (key is not None and key == _cache['key']):
+            return _cache['snapshot']
+
+        if key is None:
+            if _cache['key'] is not None:
+                config.logger.info("Library file not found, initializing empty library")
+            _cache['key'] = None
+            return _set_snapshot(MappingProxyType({}))
+
+        try:
+            library, key = store.load()
+        except Exception as e:
+            # Keep serving the last good copy; an empty one would let the next commit drop every other book
+            config.logger.error(f"Error loading library: {e}")
+            return _cache['snapshot']
+
+        _cache['key'] = key
+        return _set_snapshot(freeze(library))
 
 def load_library():
-    """Load library JSON with file locking"""
+    """Load a mutable copy of the library, served from the in-process cache"""
+    return thaw(library_snapshot())
+
+# Write-behind buffer of {asin: frozen book or None} not yet written to the store
+_pending = {'changes': {}, 'since': None}
+_flush_lock = threading.Lock()
+_flush_wakeup = threading.Condition(_cache_lock)
+_flusher = None
+
+def _patch_snapshot(current, changes):
+    """Return current with changes applied, updating the indexes; caller holds _cache_lock"""
+    updated = dict(current)
+    for asin, book in changes.items():
+        _index.update(asin, current.get(asin), book)
+        _stats.update(asin, current.get(asin), book)
+        if book is not None and book.get('cover_path'):
+            _cover_paths[asin] = book['cover_path']
+        else:
+            _cover_paths.pop(asin, None)
+        if book is None:
+            updated.pop(asin, None)
+        else:
+            updated[asin] = book
+    _version['counter'] += 1
+    for asin in changes:
+        if len(_change_log) == _change_log.maxlen:
+            _version['evicted'] = _change_log[0][0]
+        _change_log.append((_version['counter'], asin))
+    _publish_version()
+    return MappingProxyType(updated)
+
+def _commit(changes, durable=False):
+    """Apply {asin: book or None} to the cached snapshot and write it through the store
+
+    With LIBRARY_WRITE_BEHIND enabled the write is queued and coalesced with
+    other pending changes unless the caller asks for a durable commit.
+    """
+    changes = {asin: freeze(book) if book is not None else None for asin, book in changes.items()}
+
+    if not config.LIBRARY_WRITE_BEHIND:
+        with _cache_lock:
+            store = get_library_store()
+            with store.write_lock():
+                # Reload first if another process changed the store under us
+                current = library_snapshot()
+                store.write_books(changes, current)
+                _cache['key'] = store.cache_key()
+                _cache['snapshot'] = _patch_snapshot(current, changes)
+        return
+
+    with _cache_lock:
+        _cache['snapshot'] = _patch_snapshot(library_snapshot(), changes)
+        _pending['changes'].update(changes)
+        if _pending['since'] is None:
+            _pending['since'] = time.monotonic()
+        _start_flusher()
+        _flush_wakeup.notify_all()
+
+    if durable:
+        flush_library()
+
+def flush_library():
+    """Synchronously write all pending write-behind changes to the store"""
+    with _flush_lock:
+        with _cache_lock:
+            changes = _pending['changes']
+            if not changes:
+                return True
+            current = _cache['snapshot']
+            _pending['changes'] = {}
+            _pending['since'] = None
+
+        store = get_library_store()
+        try:
+            with store.write_lock():
+                key = store.cache_key()
+                stale = key is not None and key != _cache['key']
+                if not stale:
+                    store.write_books(changes, current)
+                    key = store.cache_key()
+            if stale:
+                # Another process wrote the store since we loaded it; writing `current` would undo that
+                with _cache_lock, store.write_lock():
+                    current = _reload_pending(store, changes)
+                    store.write_books(changes, current)
+                    key = store.cache_key()
+        except Exception as e:
+            config.logger.error(f"Error flushing {len(changes)} library changes: {e}")
+            with _cache_lock:
+                # Re-queue without overriding anything committed since
+                for asin, book in changes.items():
+                    _pending['changes'].setdefault(asin, book)
+                if _pending['since'] is None:
+                    _pending['since'] = time.monotonic()
+            return False
+
+        with _cache_lock:
+            _cache['key'] = key
+        return True
+
+def _reload_pending(store, changes):
+    """Reload the store and re-apply unflushed changes on top; caller holds _cache_lock and write_lock()"""
+    library, _ = store.load()
+    config.logger.info("Library changed on disk before a flush, reloading")
+    snapshot = _set_snapshot(freeze(library))
+    # The changes being flushed, then anything committed since they were taken
+    _cache['snapshot'] = _patch_snapshot(snapshot, {**changes, **_pending['changes']})
+    return _cache['snapshot']
+
+def _flush_loop():
+    while True:
+        with _cache_lock:
+            while True:
+                since = _pending['since']
+                if since is not None:
+                    if len(_pending['changes']) >= config.LIBRARY_FLUSH_MAX_PENDING:
+                        break
+                    remaining = since + config.LIBRARY_FLUSH_INTERVAL - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    _flush_wakeup.wait(remaining)
+                else:
+                    _flush_wakeup.wait()
+        if not flush_library():
+            # Back off before retrying a failing store
+            time.sleep(config.LIBRARY_FLUSH_INTERVAL)
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop, name='library-flusher', daemon=True)
+        _flusher.start()
+        atexit.register(flush_library)
+
+@contextmanager
+def library_transaction(asin=None, durable=False):
+    """Read-modify-write one book, or the whole library when no ASIN is given
+
+    Yields a mutable copy of the book (None if the ASIN is unknown) or of the
+    whole library. Changes are committed when the block exits normally and
+    discarded if it raises. Transactions on different ASINs run concurrently
+    and only write their own book; a whole-library transaction excludes all
+    others and writes back just the books it changed. Pass durable=True to
+    flush to the store before returning when write-behind is enabled.
+    """
+    if asin is None:
+        with _library_lock.exclusive():
+            base = library_snapshot()
+            library = thaw(base)
+            yield library
+            changes = {a: book for a, book in library.items() if not same_book(base.get(a), book)}
+            changes.update({a: None for a in base if a not in library})
+            if changes:
+                _commit(changes, durable)
+        return
+
+    with _library_lock.shared(), _asin_lock(asin):
+        base = library_snapshot().get(asin)
+        book = thaw(base) if base is not None else None
+        yield book
+        if book is not None and not same_book(base, book):
+            _commit({asin: book}, durable)
+
+def remove_book(asin):
+    """Delete a book entry, returning False if it was not in the library"""
+    with _library_lock.shared(), _asin_lock(asin):
+        if asin not in library_snapshot():
+            return False
+        _commit({asin: None})
+        return True
+
+def query_library(index_name, profile=ALL_PROFILES):
+    """Return [(asin, book)] for one maintained index, optionally limited to a profile
+
+    Index names are defined in utils.library_index: 'all', 'missing_audible',
+    'missing_cover', 'pdf_unknown', 'convertible' and 'locked'. Pass
+    profile=None for books without any profile.
+    """
+    with _cache_lock:
+        snapshot = library_snapshot()
+        return [(asin, snapshot[asin]) for asin in _index.query(index_name, profile)]
+
+def library_stats(profile_names=None):
+    """Return running totals, per-profile and unassigned counts and byte sizes
+
+    Each group has 'books', 'locked' and '<type>_total' counters plus
+    '<type>_size' byte totals for the audible, m4b and pdf file types
+    ('cover_total' has no size).
+    """
+    with _cache_lock:
+        library_snapshot()
+        return _stats.as_dict(profile_names)
+
+def cover_path(asin):
+    """Cover image path for an ASIN, or None, from the in-memory map
+
+    Unlike library_snapshot() this does not check the store for outside
+    changes; those are picked up by the next regular library read.
+    """
+    if _cache['key'] is _UNLOADED:
+        library_snapshot()
+    return _cover_paths.get(asin)
+
+def library_version():
+    """Opaque token that changes whenever the library does"""
+    with _cache_lock:
+        library_snapshot()
+        return f"{_version['epoch']}-{_version['counter']}"
+
+def library_changes(since):
+    """Return the books changed after version token `since`
+
+    The result carries the current version, the changed books, the ASINs
+    removed since then, and reset=True when the change log cannot answer
+    (a restart, a full reload, or a gap older than the retained log), in
+    which case the caller should refetch the whole library.
+    """
+    with _cache_lock:
+        snapshot = library_snapshot()
+        version = f"{_version['epoch']}-{_version['counter']}"
+        try:
+            epoch, counter = since.rsplit('-', 1)
+            counter = int(counter)
+        except (AttributeError, ValueError):
+            epoch, counter = None, -1
+
+        reset = (
+            epoch != _version['epoch']
+            or counter > _version['counter']
+            or counter < _version['reset_at']
+            or counter < _version['evicted']
+        )
+        if reset:
+            return {'version': version, 'reset': True, 'books': [], 'removed': []}
+
+        changed = {}
+        for seq, asin in reversed(_change_log):
+            if seq <= counter:
+                break
+            changed.setdefault(asin, None)
+
+    books, removed = [], []
+    for asin in changed:
+        book = snapshot.get(asin)
+        if book is None:
+            removed.append(asin)
+        else:
+            entry = thaw(book)
+            entry['asin'] = asin
+            books.append(entry)
+    return {'version': version, 'reset': False, 'books': books, 'removed': removed}
+
+# Sort name -> book field for library_page(); prefix with '-' for descending
+SORT_FIELDS = {
+    'title': 'amazon_title',
+    'author': 'author',
+    'series': 'series',
+    'purchase_date': 'purchase_date',
+    'release_date': 'release_date',
+    'asin': None,
+}
+_order_cache = {}
+
+def _sorted_keys(profile, field):
+    """(sort value, asin) keys for one profile in ascending order, cached per version"""
+    cache_key = (_version['counter'], profile, field)
+    keys = _order_cache.get(cache_key)
+    if keys is None:
+        snapshot = _cache['snapshot']
+        keys = sorted(
+            (str(snapshot[asin].get(field) or '').lower() if field else '', asin)
+            for asin in _index.query('all', profile)
+        )
+        if len(_order_cache) > 32 or any(k[0] != _version['counter'] for k in _order_cache):
+            _order_cache.clear()
+        _order_cache[cache_key] = keys
+    return keys
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+def _decode_cursor(cursor):
     try:
-        if not os.path.exists(config.LIBRARY_FILE):
-            config.logger.info("Library file not found, initializing empty library")
-            return {}
-
-        with open(config.LIBRARY_FILE, 'r') as f:
-            fcntl.flock(f, fcntl.LOCK_SH)
-            try:
-                library = json.load(f)
-                return library
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
-    except Exception as e:
-        config.logger.error(f"Error loading library: {e}")
-        return {}
+        value, asin = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (str(value), str(asin))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def library_page(profile=ALL_PROFILES, sort='title', cursor=None, limit=100, fields=None):
+    """Return one page of books using keyset pagination over a sorted profile view
+
+    The cursor encodes the sort key of the last book returned, so pages stay
+    consistent while books are added or removed between requests. fields
+    limits each book to the given keys (the ASIN is always included).
+    """
+    descending = sort.startswith('-')
+    sort_name = sort.lstrip('-')
+    if sort_name not in SORT_FIELDS:
+        raise ValueError(f"Unknown sort field: {sort_name}")
+
+    with _cache_lock:
+        snapshot = library_snapshot()
+        keys = _sorted_keys(profile, SORT_FIELDS[sort_name])
+        version = f"{_version['epoch']}-{_version['counter']}"
+
+    after = _decode_cursor(cursor) if cursor else None
+    if descending:
+        end = bisect.bisect_left(keys, after) if after else len(keys)
+        page_keys = keys[max(0, end - limit):end][::-1]
+        has_more = end - limit > 0
+    else:
+        start = bisect.bisect_right(keys, after) if after else 0
+        page_keys = keys[start:start + limit]
+        has_more = start + limit < len(keys)
+
+    books = []
+    for _, asin in page_keys:
+        book = snapshot[asin]
+        if fields:
+            entry = {field: thaw(book[field]) for field in fields if field in book}
+        else:
+            entry = thaw(book)
+        entry['asin'] = asin
+        books.append(entry)
+
+    return {
+        'books': books,
+        'total': len(keys),
+        'next_cursor': _encode_cursor(page_keys[-1]) if has_more and page_keys else None,
+        'version': version,
+    }
 
 def save_library(library_data, log_save=False):
-    """Save library JSON with atomic operation and locking"""
-    try:
-        os.makedirs(config.CONFIG_DIR, exist_ok=True)
+    """Replace the whole library through the configured store and refresh the cache
 
-        temp_fd, temp_path = tempfile.mkstemp(dir=config.CONFIG_DIR)
-        with os.fdopen(temp_fd, 'w') as temp_file:
-            fcntl.flock(temp_fd, fcntl.LOCK_EX)
-            try:
-                json.dump(library_data, temp_file, indent=2)
+    Prefer library_transaction(), which only writes what changed and does not
+    clobber concurrent updates to other books.
+    """
+    try:
+        with _library_lock.exclusive():
+            flush_library()
+            with _cache_lock:
+                store = get_library_store()
+                previous = library_snapshot()
+                with store.write_lock():
+                    store.save(library_data, previous=previous)
                 if log_save:
                     config.logger.info(f"Library saved with {len(library_data)} entries")
-            finally:
-                fcntl.flock(temp_fd, fcntl.LOCK_UN)
-        os.rename(temp_path, config.LIBRARY_FILE)
+
+                # Refresh the cache from what we just wrote instead of re-reading it
+                _cache['key'] = store.cache_key()
+                _set_snapshot(freeze(library_data))
         return True
     except Exception as e:
         config.logger.error(f"Error saving library: {e}")
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
         return False
 
+def export_library_json(path):
+    """Export the current library to a JSON file, returning the number of books written"""
+    library = load_library()
+    JsonLibraryStore(path).save(library)
+    return len(library)
+
 def update_book_database(profile_name):
     """Update library from Audible CLI export"""
     try:
@@ -123,65 +593,55 @@ def merge_book_data(existing_book, new_book, profile_name):
 
 def verify_files():
     """Verify stored files exist and update sizes"""
-    library = load_library()
-    changes = False
-    
-    config.logger.info(f"Starting verification of {len(library)} books")
-    
     audible_verified = 0
     m4b_verified = 0
     missing_files = []
     vouchers_added = 0
-    
-    for asin, book in library.items():
-        book_title = book.get('amazon_title', 'Unknown')
-        
-        # Check Audible file
-        if book.get('audible_file'):
-            path = Path(book['audible_file'])
-            if not path.exists():
-                config.logger.warning(f"Audible file missing for '{book_title}' ({asin}): {path}")
-                missing_files.append(f"Audible: {book_title}")
-                del book['audible_file']
-                del book['audible_size']
-                del book['audible_format']
-                changes = True
-            else:
-                current_size = path.stat().st_size
-                if current_size != book.get('audible_size'):
-                    book['audible_size'] = current_size
-                    changes = True
-                audible_verified += 1
-
-                # Check for AAXC files missing voucher links
-                if path.suffix == '.aaxc' and not book.get('voucher_file'):
-                    # Look for matching voucher file
-                    voucher_path = path.with_suffix('.voucher')
-                    if voucher_path.exists():
-                        book['voucher_file'] = str(voucher_path)
-                        config.logger.info(f"Added missing voucher file link for '{book_title}': {voucher_path}")
-                        vouchers_added += 1
-                        changes = True
-                    
-        # Check M4B file
-        if book.get('m4b_file'):
-            path = Path(book['m4b_file'])
-            if not path.exists():
-                config.logger.warning(f"M4B file missing for '{book_title}' ({asin}): {path}")
-                missing_files.append(f"M4B: {book_title}")
-                del book['m4b_file']
-                del book['m4b_size']
-                changes = True
-            else:
-                current_size = path.stat().st_size
-                if current_size != book.get('m4b_size'):
-                    book['m4b_size'] = current_size
-                    changes = True
-                m4b_verified += 1
-    
-    if changes:
-        save_library(library)
-        
+
+    with library_transaction() as library:
+        config.logger.info(f"Starting verification of {len(library)} books")
+
+        for asin, book in library.items():
+            book_title = book.get('amazon_title', 'Unknown')
+
+            # Check Audible file
+            if book.get('audible_file'):
+                path = Path(book['audible_file'])
+                if not path.exists():
+                    config.logger.warning(f"Audible file missing for '{book_title}' ({asin}): {path}")
+                    missing_files.append(f"Audible: {book_title}")
+                    del book['audible_file']
+                    del book['audible_size']
+                    del book['audible_format']
+                else:
+                    current_size = path.stat().st_size
+                    if current_size != book.get('audible_size'):
+                        book['audible_size'] = current_size
+                    audible_verified += 1
+
+                    # Check for AAXC files missing voucher links
+                    if path.suffix == '.aaxc' and not book.get('voucher_file'):
+                        # Look for matching voucher file
+                        voucher_path = path.with_suffix('.voucher')
+                        if voucher_path.exists():
+                            book['voucher_file'] = str(voucher_path)
+                            config.logger.info(f"Added missing voucher file link for '{book_title}': {voucher_path}")
+                            vouchers_added += 1
+
+            # Check M4B file
+            if book.get('m4b_file'):
+                path = Path(book['m4b_file'])
+                if not path.exists():
+                    config.logger.warning(f"M4B file missing for '{book_title}' ({asin}): {path}")
+                    missing_files.append(f"M4B: {book_title}")
+                    del book['m4b_file']
+                    del book['m4b_size']
+                else:
+                    current_size = path.stat().st_size
+                    if current_size != book.get('m4b_size'):
+                        book['m4b_size'] = current_size
+                    m4b_verified += 1
+
     config.logger.info(
         f"Verification complete:\n"
         f"- Verified {audible_verified} Audible files\n"
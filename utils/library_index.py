@@ -0,0 +1,142 @@
+from collections import defaultdict
+
+# Profile key for books not assigned to any profile, and for queries across all profiles
+UNASSIGNED = None
+ALL_PROFILES = '*'
+
+def _pdf_unknown(book):
+    return 'pdf_available' not in book or (book.get('pdf_available', True) and not book.get('pdf_file'))
+
+# Index name -> membership test applied to a single book
+INDEX_PREDICATES = {
+    'all': lambda book: True,
+    'missing_audible': lambda book: not book.get('audible_file') and not book.get('locked', False),
+    'missing_cover': lambda book: not book.get('cover_path'),
+    'pdf_unknown': _pdf_unknown,
+    'convertible': lambda book: bool(book.get('audible_file')) and not book.get('m4b_file'),
+    'locked': lambda book: bool(book.get('locked', False)),
+}
+
+class LibraryIndex:
+    """Incrementally maintained profile -> ASIN indexes over the library
+
+    Each bucket is keyed by (profile, index name) and holds an insertion
+    ordered set of ASINs, so queries cost time proportional to their result
+    rather than to the size of the library.
+    """
+
+    def __init__(self):
+        self._buckets = defaultdict(dict)
+
+    @staticmethod
+    def _keys(book):
+        if book is None:
+            return set()
+        profiles = book.get('profiles') or [UNASSIGNED]
+        keys = set()
+        for name, predicate in INDEX_PREDICATES.items():
+            if predicate(book):
+                keys.add((ALL_PROFILES, name))
+                keys.update((profile, name) for profile in profiles)
+        return keys
+
+    def rebuild(self, library):
+        """Recompute every bucket from a full library mapping"""
+        self._buckets = defaultdict(dict)
+        for asin, book in library.items():
+            for key in self._keys(book):
+                self._buckets[key][asin] = None
+
+    def update(self, asin, old_book, new_book):
+        """Move one book between buckets after it changed (None = absent)"""
+        old_keys = self._keys(old_book)
+        new_keys = self._keys(new_book)
+        for key in old_keys - new_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.pop(asin, None)
+                if not bucket:
+                    del self._buckets[key]
+        for key in new_keys - old_keys:
+            self._buckets[key][asin] = None
+
+    def query(self, name, profile=ALL_PROFILES):
+        """Return the ASINs in one bucket, in insertion order"""
+        if name not in INDEX_PREDICATES:
+            raise KeyError(f"Unknown library index: {name}")
+        return list(self._buckets.get((profile, name), ()))
+
+    def count(self, name, profile=ALL_PROFILES):
+        return len(self._buckets.get((profile, name), ()))
+
+# (counter name, field that must be set, size field) for each tracked file type
+FILE_TYPES = [
+    ('audible', 'audible_file', 'audible_size'),
+    ('m4b', 'm4b_file', 'm4b_size'),
+    ('pdf', 'pdf_file', 'pdf_size'),
+    ('cover', 'cover_path', None),
+]
+
+def _empty_counters():
+    counters = {'books': 0, 'locked': 0}
+    for name, _, size_field in FILE_TYPES:
+        counters[f'{name}_total'] = 0
+        if size_field:
+            counters[f'{name}_size'] = 0
+    return counters
+
+class LibraryStats:
+    """Running counts and byte totals, overall, per profile and for unassigned books
+
+    Each book's contribution is subtracted and re-added when it changes, so
+    reading the aggregates is O(1) regardless of library size.
+    """
+
+    def __init__(self):
+        self.totals = _empty_counters()
+        self.profiles = defaultdict(_empty_counters)
+        self.unassigned = _empty_counters()
+
+    @staticmethod
+    def _contribution(book):
+        counters = {'books': 1, 'locked': 1 if book.get('locked', False) else 0}
+        for name, file_field, size_field in FILE_TYPES:
+            if book.get(file_field):
+                counters[f'{name}_total'] = 1
+                if size_field:
+                    counters[f'{name}_size'] = book.get(size_field, 0) or 0
+        return counters
+
+    def _apply(self, book, sign):
+        if book is None:
+            return
+        contribution = self._contribution(book)
+        targets = [self.totals]
+        profiles = book.get('profiles') or []
+        if profiles:
+            targets.extend(self.profiles[profile] for profile in profiles)
+        else:
+            targets.append(self.unassigned)
+        for counters in targets:
+            for key, value in contribution.items():
+                counters[key] += sign * value
+
+    def rebuild(self, library):
+        self.__init__()
+        for book in library.values():
+            self._apply(book, 1)
+
+    def update(self, asin, old_book, new_book):
+        self._apply(old_book, -1)
+        self._apply(new_book, 1)
+
+    def as_dict(self, profile_names=None):
+        """Copy of the aggregates; profile_names pre-seeds zeroed entries for empty profiles"""
+        profiles = {name: dict(counters) for name, counters in self.profiles.items() if counters['books']}
+        for name in profile_names or []:
+            profiles.setdefault(name, _empty_counters())
+        return {
+            'totals': dict(self.totals),
+            'profiles': profiles,
+            'unassigned': dict(self.unassigned),
+        }
@@ -0,0 +1,212 @@
+import json
+import fcntl
+import sqlite3
+import tempfile
+import threading
+import os
+from contextlib import contextmanager
+from collections.abc import Mapping
+import config
+
+def same_book(a, b):
+    """Compare two book records, treating frozen snapshots and plain dicts/lists alike"""
+    if isinstance(a, Mapping) and isinstance(b, Mapping):
+        return len(a) == len(b) and all(k in b and same_book(v, b[k]) for k, v in a.items())
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_book(x, y) for x, y in zip(a, b))
+    return a == b
+
+def _jsonable(value):
+    """json.dump fallback for read-only mappings taken from a library snapshot"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class JsonLibraryStore:
+    """Library stored as a single JSON document, rewritten on every save"""
+
+    name = 'json'
+
+    def __init__(self, path=None):
+        self.path = path or config.LIBRARY_FILE
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def write_lock(self):
+        """Serialize read-modify-write cycles across threads and processes"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def cache_key(self):
+        """Identify the current library file by inode, mtime and size"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        """Return (library, cache_key) for the file as it was parsed"""
+        with open(self.path, 'r') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                library = json.load(f)
+                # Key on the descriptor we actually parsed in case of a concurrent rename
+                st = os.fstat(f.fileno())
+                return library, (st.st_ino, st.st_mtime_ns, st.st_size)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save(self, library_data, previous=None):
+        """Atomically replace the library file"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+        temp_fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(temp_fd, 'w') as temp_file:
+                json.dump(library_data, temp_file, indent=2, default=_jsonable)
+            os.rename(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def write_books(self, changes, current):
+        """Apply {asin: book or None} on top of the current library; caller holds write_lock()"""
+        library = {asin: book for asin, book in current.items()}
+        for asin, book in changes.items():
+            if book is None:
+                library.pop(asin, None)
+            else:
+                library[asin] = book
+        self.save(library)
+
+class SqliteLibraryStore:
+    """Library stored one row per ASIN in SQLite (WAL mode)
+
+    Saves are diffed against the previously loaded state so only books whose
+    fields actually changed are written.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=None, json_path=None):
+        self.path = path or config.LIBRARY_DB
+        self.json_path = json_path or config.LIBRARY_FILE
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS books (asin TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._conn = conn
+            self._migrate_from_json()
+        return self._conn
+
+    def _migrate_from_json(self):
+        """One-time import of an existing library.json into an empty database"""
+        conn = self._conn
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return
+        if not conn.execute('SELECT 1 FROM books LIMIT 1').fetchone() and os.path.exists(self.json_path):
+            library, _ = JsonLibraryStore(self.json_path).load()
+            self._write(library, {})
+            config.logger.info(f"Migrated {len(library)} books from {self.json_path} to {self.path}")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', '1')")
+
+    def cache_key(self):
+        """Change token for the database: inode plus SQLite's data_version"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return None
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            return (st.st_ino, data_version)
+
+    @contextmanager
+    def write_lock(self):
+        """Serialize writers in this process; SQLite locks across processes"""
+        with self._lock:
+            yield
+
+    def load(self):
+        """Return (library, cache_key) read in a single transaction"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                rows = conn.execute('SELECT asin, data FROM books ORDER BY rowid').fetchall()
+                key = self.cache_key()
+            finally:
+                conn.execute('COMMIT')
+            return {asin: json.loads(data) for asin, data in rows}, key
+
+    def save(self, library_data, previous=None):
+        """Write only the books that differ from the previously loaded state"""
+        with self._lock:
+            self._connect()
+            if previous is None:
+                previous, _ = self.load()
+            self._write(library_data, previous)
+
+    def write_books(self, changes, current=None):
+        """Upsert or delete ({asin: None}) just the given books"""
+        with self._lock:
+            self._connect()
+            self._apply(
+                [(asin, json.dumps(book, default=_jsonable)) for asin, book in changes.items() if book is not None],
+                [(asin,) for asin, book in changes.items() if book is None]
+            )
+
+    def _write(self, library_data, previous):
+        changed = [
+            (asin, json.dumps(book, default=_jsonable))
+            for asin, book in library_data.items()
+            if not same_book(previous.get(asin), book)
+        ]
+        removed = [(asin,) for asin in previous if asin not in library_data]
+        self._apply(changed, removed)
+
+    def _apply(self, changed, removed):
+        if not changed and not removed:
+            return
+
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO books (asin, data) VALUES (?, ?) '
+                'ON CONFLICT(asin) DO UPDATE SET data = excluded.data',
+                changed
+            )
+            conn.executemany('DELETE FROM books WHERE asin = ?', removed)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def export_json(self, path):
+        """Write the whole library back out as a JSON document"""
+        library, _ = self.load()
+        JsonLibraryStore(path).save(library)
+        return len(library)
+
+def get_store():
+    """Create the library store selected by config.LIBRARY_BACKEND"""
+    if config.LIBRARY_BACKEND == 'sqlite':
+        return SqliteLibraryStore()
+    return JsonLibraryStore()
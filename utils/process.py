@@ -0,0 +1,286 @@
+import os
+import sys
+import time
+import codecs
+import signal
+import selectors
+import threading
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import config
+
+# A partial line longer than this is handed to callbacks as-is
+_MAX_LINE = 64 * 1024
+_KILL_GRACE = 5
+
+@dataclass
+class ProcessResult:
+    returncode: int
+    stdout_tail: deque = field(default_factory=deque)
+    stderr_tail: deque = field(default_factory=deque)
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    max_rss: int = 0
+    killed: str = None
+    cancelled: bool = False
+
+    @property
+    def success(self):
+        return self.returncode == 0 and self.killed is None
+
+    @property
+    def stdout(self):
+        return '\n'.join(self.stdout_tail)
+
+    @property
+    def stderr(self):
+        return '\n'.join(self.stderr_tail)
+
+    def stats(self):
+        return {
+            'returncode': self.returncode,
+            'wall_time': round(self.wall_time, 3),
+            'cpu_time': round(self.cpu_time, 3),
+            'max_rss': self.max_rss,
+        }
+
+class _Stream:
+    """Splits one pipe's bytes into lines, keeping the most recent ones"""
+
+    def __init__(self, callback, tail_lines):
+        self.callback = callback
+        self.tail = deque(maxlen=tail_lines)
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ''
+
+    def feed(self, data, final=False):
+        text = self._pending + self._decoder.decode(data, final)
+        # tqdm redraws progress with \r, so treat it as a line end too
+        lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        self._pending = lines.pop()
+        if final or len(self._pending) > _MAX_LINE:
+            if self._pending:
+                lines.append(self._pending)
+            self._pending = ''
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            self.tail.append(line)
+            if self.callback:
+                self.callback(line)
+
+class Cancelled(Exception):
+    """A process was about to start on behalf of work that has been cancelled"""
+
+class CancelToken:
+    """Lets another thread stop the child processes started under a cancel_scope"""
+
+    def __init__(self):
+        self.reason = None
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def cancel(self, reason='Cancelled'):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            processes = list(self._processes)
+        for process in processes:
+            _kill_group(process, signal.SIGTERM)
+
+    def _attach(self, process):
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self._processes.add(process)
+            return True
+
+    def _detach(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+_local = threading.local()
+
+@contextmanager
+def cancel_scope(token):
+    """Make run_process calls on this thread stoppable through token"""
+    previous = getattr(_local, 'token', None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+def current_cancel_token():
+    """The token of this thread's innermost cancel_scope, if any"""
+    return getattr(_local, 'token', None)
+
+def _kill_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _reap(process, deadline):
+    """Wait for the child, escalating to SIGKILL past deadline; returns (status, rusage)"""
+    if deadline is None:
+        _, status, rusage = os.wait4(process.pid, 0)
+        return status, rusage
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            return status, rusage
+        if deadline is not None and time.monotonic() > deadline:
+            _kill_group(process, signal.SIGKILL)
+            deadline = None
+        time.sleep(0.05)
+
+def run_process(command, on_stdout=None, on_stderr=None, input_data=None, timeout=None,
+                watchdog=None, tail_lines=None, shell=False, stdin=None, stdout=None):
+    """Run a command, dispatching its output line by line as it arrives
+
+    Both pipes are multiplexed with selectors, so neither can fill up and
+    block the child. on_stdout/on_stderr are called with each stripped,
+    non-empty line; only the last tail_lines of each stream are kept.
+    watchdog, if given, is called about once a second and may return a
+    reason string to stop the process. The child runs in its own session
+    so timeouts, watchdog stops and cancellation through the thread's
+    cancel_scope kill its whole process group.
+
+    stdin and stdout may be file descriptors (such as the ends of an
+    os.pipe) to chain processes together without copying through Python.
+    A stdin descriptor is closed here once the child holds it; on_stdout
+    is not called when stdout is redirected.
+    """
+    token = getattr(_local, 'token', None)
+    try:
+        if token is not None and token.cancelled:
+            raise Cancelled(token.reason)
+        start = time.monotonic()
+        process = subprocess.Popen(
+            command,
+            stdin=stdin if stdin is not None else subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+            stdout=stdout if stdout is not None else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=shell,
+            start_new_session=True
+        )
+    finally:
+        # Otherwise a writer to this pipe would never see the reader go away
+        if stdin is not None:
+            os.close(stdin)
+    if token is not None and not token._attach(process):
+        _kill_group(process, signal.SIGTERM)
+    tail_lines = tail_lines or config.PROCESS_TAIL_LINES
+    stdout_stream = _Stream(on_stdout, tail_lines)
+    stderr_stream = _Stream(on_stderr, tail_lines)
+    streams = {process.stderr.fileno(): stderr_stream}
+    if process.stdout is not None:
+        streams[process.stdout.fileno()] = stdout_stream
+    deadline = start + timeout if timeout else None
+    pending_input = memoryview(input_data.encode() if isinstance(input_data, str) else input_data or b'')
+
+    try:
+        killed, kill_deadline = _pump(process, streams, pending_input, deadline, watchdog, command, token)
+    except BaseException:
+        # A callback failed: don't leave the child running behind us
+        _kill_group(process, signal.SIGKILL)
+        process.wait()
+        raise
+    finally:
+        if token is not None:
+            token._detach(process)
+        for pipe in (process.stdin, process.stdout, process.stderr):
+            if pipe and not pipe.closed:
+                pipe.close()
+
+    if killed and kill_deadline is None:
+        kill_deadline = time.monotonic()
+    elif deadline is not None and kill_deadline is None:
+        kill_deadline = max(deadline, time.monotonic())
+    status, rusage = _reap(process, kill_deadline)
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+    result = ProcessResult(
+        returncode=process.returncode,
+        stdout_tail=stdout_stream.tail,
+        stderr_tail=stderr_stream.tail,
+        wall_time=time.monotonic() - start,
+        cpu_time=rusage.ru_utime + rusage.ru_stime,
+        max_rss=max_rss,
+        killed=killed,
+        cancelled=token is not None and killed is not None and killed == token.reason
+    )
+    config.logger.info(
+        f"{_name(command)} exited with {result.returncode} in {result.wall_time:.1f}s "
+        f"(cpu {result.cpu_time:.1f}s, peak RSS {result.max_rss / 1e6:.0f} MB)"
+    )
+    return result
+
+def _pump(process, streams, pending_input, deadline, watchdog, command, token):
+    """Move data through the pipes until both output streams hit EOF; returns (killed, kill_deadline)"""
+    killed = None
+    kill_deadline = None
+    with selectors.DefaultSelector() as selector:
+        for fd in streams:
+            selector.register(fd, selectors.EVENT_READ)
+        if process.stdin is not None:
+            os.set_blocking(process.stdin.fileno(), False)
+            selector.register(process.stdin.fileno(), selectors.EVENT_WRITE)
+
+        next_check = time.monotonic() + 1
+        while selector.get_map():
+            now = time.monotonic()
+            wait = next_check - now
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            for key, _ in selector.select(max(wait, 0)):
+                fd = key.fd
+                if fd in streams:
+                    data = os.read(fd, 65536)
+                    if data:
+                        streams[fd].feed(data)
+                    else:
+                        streams[fd].feed(b'', final=True)
+                        selector.unregister(fd)
+                    continue
+                try:
+                    written = os.write(fd, pending_input[:65536])
+                    pending_input = pending_input[written:]
+                except BrokenPipeError:
+                    pending_input = pending_input[:0]
+                if not pending_input:
+                    selector.unregister(fd)
+                    process.stdin.close()
+
+            now = time.monotonic()
+            if killed is None:
+                if token is not None and token.cancelled:
+                    killed = token.reason
+                elif deadline is not None and now >= deadline:
+                    killed = 'Process timeout exceeded'
+                elif watchdog and now >= next_check:
+                    killed = watchdog()
+                if killed:
+                    config.logger.warning(f"Stopping {_name(command)} (pid {process.pid}): {killed}")
+                    _kill_group(process, signal.SIGTERM)
+                    kill_deadline = now + _KILL_GRACE
+            elif kill_deadline is not None and now >= kill_deadline:
+                _kill_group(process, signal.SIGKILL)
+                kill_deadline = None
+            if now >= next_check:
+                next_check = now + 1
+    return killed, kill_deadline
+
+def _name(command):
+    return os.path.basename((command.split() if isinstance(command, str) else command)[0])
@@ -0,0 +1,119 @@
+import os
+import threading
+from collections import OrderedDict
+import config
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; covers are then served at full size
+    Image = None
+
+# Serialize generation per variant so concurrent requests don't resize the same cover twice
+_generate_locks = {}
+_generate_locks_guard = threading.Lock()
+
+# path -> size in bytes of every variant on disk, least recently used first
+_cache_lock = threading.Lock()
+_entries = None
+_total = {'bytes': 0}
+
+def _variant_path(asin, size):
+    return os.path.join(config.THUMBNAIL_DIR, f"{asin}_{size}.jpg")
+
+def _generate_lock(path):
+    with _generate_locks_guard:
+        return _generate_locks.setdefault(path, threading.Lock())
+
+def _load_entries():
+    """Index the variants already on disk, oldest access first; caller holds _cache_lock"""
+    global _entries
+    if _entries is not None:
+        return
+    _entries = OrderedDict()
+    _total['bytes'] = 0
+    found = []
+    try:
+        with os.scandir(config.THUMBNAIL_DIR) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.jpg'):
+                    st = entry.stat()
+                    found.append((st.st_atime, entry.path, st.st_size))
+    except FileNotFoundError:
+        pass
+    for _, path, size in sorted(found):
+        _entries[path] = size
+        _total['bytes'] += size
+
+def _touch(path, size=None):
+    """Mark a variant as recently used, recording its size if it was (re)written"""
+    with _cache_lock:
+        _load_entries()
+        if size is not None:
+            _total['bytes'] += size - _entries.get(path, 0)
+            _entries[path] = size
+        if path in _entries:
+            _entries.move_to_end(path)
+        _evict(keep=path)
+
+def _evict(keep):
+    """Remove least recently used variants until the cache fits; caller holds _cache_lock"""
+    while _total['bytes'] > config.THUMBNAIL_CACHE_MAX_BYTES and len(_entries) > 1:
+        path, size = next(iter(_entries.items()))
+        if path == keep:
+            _entries.move_to_end(path)
+            continue
+        del _entries[path]
+        _total['bytes'] -= size
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def _generate(source, path, width, source_mtime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    try:
+        with Image.open(source) as image:
+            image.draft('RGB', (width, width))  # Let the JPEG decoder downscale cheaply
+            image = image.convert('RGB')
+            image.thumbnail((width, width))
+            image.save(temp_path, 'JPEG', quality=85, optimize=True)
+        # Stamp the variant with its source's mtime so a changed cover is noticed
+        os.utime(temp_path, ns=(source_mtime, source_mtime))
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return os.path.getsize(path)
+
+def get_thumbnail(asin, source, size):
+    """Path of the `size` variant of a cover, generating it if missing or stale
+
+    Returns None when Pillow isn't installed, the size is unknown or the
+    cover can't be resized, so callers can fall back to the original.
+    """
+    width = config.THUMBNAIL_SIZES.get(size)
+    if Image is None or not width:
+        return None
+
+    path = _variant_path(asin, size)
+    try:
+        source_mtime = os.stat(source).st_mtime_ns
+        with _generate_lock(path):
+            try:
+                if os.stat(path).st_mtime_ns == source_mtime:
+                    _touch(path)
+                    return path
+            except FileNotFoundError:
+                pass
+            _touch(path, _generate(source, path, width, source_mtime))
+            return path
+    except Exception as e:
+        config.logger.error(f"Error creating {size} thumbnail for {asin}: {e}")
+        return None
+
+def generate_thumbnails(asin, source):
+    """Pre-size every configured variant of a freshly downloaded cover"""
+    for size in config.THUMBNAIL_SIZES:
+        get_thumbnail(asin, source, size)
@@ -0,0 +1,105 @@
+import os
+import fcntl
+import shutil
+import tempfile
+import threading
+import config
+
+_OWNER_FILE = '.owner'
+_lock = threading.Lock()
+
+class InsufficientSpace(OSError):
+    """Not enough free space on the scratch volume to start a conversion"""
+
+class Workspace:
+    """A private scratch directory for one conversion, removed again by cleanup()
+
+    The owner file stays flock()ed while the workspace lives; the kernel
+    drops the lock when the process dies, which is how sweeps tell an
+    orphan from a workspace in use (pids repeat across container restarts).
+    """
+
+    def __init__(self, path, owner):
+        self.path = path
+        self._owner = owner
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def publish(self, temp_path, final_path):
+        """Move a finished file into place; atomic when the workspace shares final_path's filesystem"""
+        final_path = str(final_path)
+        try:
+            os.replace(temp_path, final_path)
+        except OSError as e:
+            if e.errno != getattr(os, 'EXDEV', 18):
+                raise
+            # Different filesystem: copy next to the target first so the final step is still a rename
+            staging = f"{final_path}.part"
+            try:
+                shutil.copyfile(temp_path, staging)
+                os.replace(staging, final_path)
+            except Exception:
+                if os.path.exists(staging):
+                    os.unlink(staging)
+                raise
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._owner.close()
+
+def create_workspace(name, required_bytes=0):
+    """Make a uniquely named workspace under CONVERSION_SCRATCH_DIR after checking free space"""
+    root = config.CONVERSION_SCRATCH_DIR
+    os.makedirs(root, exist_ok=True)
+    with _lock:
+        free = shutil.disk_usage(root).free
+        needed = required_bytes + config.SCRATCH_MIN_FREE_BYTES
+        if free < needed:
+            raise InsufficientSpace(
+                f"Not enough scratch space in {root}: {free / 1e9:.1f} GB free, {needed / 1e9:.1f} GB needed"
+            )
+        path = tempfile.mkdtemp(prefix=f"{name}-", dir=root)
+        owner = open(os.path.join(path, _OWNER_FILE), 'w')
+        fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    owner.write(str(os.getpid()))
+    owner.flush()
+    return Workspace(path, owner)
+
+def _in_use(path):
+    """Whether a live workspace still holds the lock on path's owner file"""
+    try:
+        fd = os.open(os.path.join(path, _OWNER_FILE), os.O_RDONLY)
+    except FileNotFoundError:
+        # Crashed between creating the directory and its owner file
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+def sweep_workspaces():
+    """Remove workspaces left behind by conversions whose process is no longer running"""
+    root = config.CONVERSION_SCRATCH_DIR
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    for entry in os.scandir(root):
+        if entry.is_dir(follow_symlinks=False) and not _in_use(entry.path):
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    if removed:
+        config.logger.info(f"Removed {removed} orphaned conversion workspaces from {root}")
+
+    try:
+        if os.stat(root).st_dev != os.stat(config.M4B_DIR).st_dev:
+            config.logger.warning(
+                f"Scratch directory {root} is not on the same filesystem as {config.M4B_DIR}; "
+                f"finished books will be copied instead of renamed into place"
+            )
+    except OSError:
+        pass
+    return removed